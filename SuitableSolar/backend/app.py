@@ -1,11 +1,19 @@
-from math import radians, sin, cos, asin, sqrt
+from math import radians, sin, cos, asin, sqrt, isfinite
 from pathlib import Path
-import sqlite3
+import base64
+import hashlib
+import json
+import numpy as np
 from flask import Flask, request, jsonify
+from geo_index import GeoIndex, haversine_km_array, smallest
+from db import db_signature, read_pool
+from ttl_cache import TTLCache
 
 DB_PATH = Path(__file__).with_name("locations.db")
 
 app = Flask(__name__)
+geo_index = GeoIndex(DB_PATH)
+substation_index = GeoIndex(DB_PATH, "SELECT id, lat, lon FROM substations")
 
 # CORS (allow all)
 @app.after_request
@@ -16,9 +24,8 @@ def add_cors_headers(resp):
     return resp
 
 def db():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    """Pooled read-only connection; use as ``with db() as con:``."""
+    return read_pool(DB_PATH).connection()
 
 # Haversine distance in kilometers
 def haversine_km(lat1, lon1, lat2, lon2):
@@ -33,7 +40,127 @@ def bbox(lat, lon, km):
     lon_deg = km / (111.0 * max(0.0001, cos(radians(lat))))
     return (lat - lat_deg, lat + lat_deg, lon - lon_deg, lon + lon_deg)
 
-ALLOWED_SORT = {"id","solar_score","annual_ghi","grid_distance","slope","area","solar_day_length"}
+# Ids inside a lat/lon box, answered by the R*-tree (see schema.py).
+# Overlap tests because the rtree stores rounded-outward float32 bounds.
+RTREE_BBOX = """
+    SELECT id FROM locations_rtree
+    WHERE max_lat >= :lat_min AND min_lat <= :lat_max
+      AND max_lon >= :lon_min AND min_lon <= :lon_max
+"""
+
+# The trigram FTS index (see schema.py) needs at least 3 characters;
+# shorter queries fall back to LIKE
+FTS_MIN_CHARS = 3
+
+def fts_phrase(q):
+    """q as a single FTS5 phrase, i.e. a case-insensitive substring match."""
+    return '"' + q.replace('"', '""') + '"'
+
+def like_escape(q):
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# API field -> locations column
+COLUMNS = {
+    "id": "id",
+    "address": "Address",
+    "latitude": "Latitude",
+    "longitude": "Longitude",
+    "annual_ghi": "Annual_GHI",
+    "annual_tilt": "Annual_Tilt_Latitude",
+    "grid_distance": "nearest_substation_km",
+    "solar_score": "solar_score",
+    "area": "acres",
+    "slope": "tilt_deg",
+}
+LIST_COLUMNS = ", ".join(f"{col} AS {name}" for name, col in COLUMNS.items())
+
+ALLOWED_SORT = {"id","solar_score","annual_ghi","grid_distance","slope","area"}
+
+def rows_by_id(con, ids, columns=LIST_COLUMNS):
+    """Full rows for ``ids`` as dicts, in the order given."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    placeholders = ",".join("?" * len(ids))
+    rows = con.execute(
+        f"SELECT {columns} FROM locations WHERE id IN ({placeholders})", ids).fetchall()
+    by_id = {r["id"]: dict(r) for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+def within_km(con, lat, lon, km, where_sql="", params=None, after=None, limit=None):
+    """
+    Ids and distances of rows within ``km`` of (lat, lon), ordered by
+    (distance, id) and starting strictly after ``after`` if given.
+
+    Candidates come from the R*-tree as bare (id, lat, lon) tuples; the
+    distances are computed for the whole batch at once and only the
+    ``limit`` closest survivors are sorted. Also returns the total number
+    of rows in range.
+    """
+    params = dict(params or {})
+    lat_min, lat_max, lon_min, lon_max = bbox(lat, lon, km * 1.2)
+    params.update({"lat_min": lat_min, "lat_max": lat_max, "lon_min": lon_min, "lon_max": lon_max})
+    where_sql = f"WHERE {where_sql} AND" if where_sql else "WHERE"
+    # id order lets smallest() break distance ties by id
+    cand = con.execute(f"""
+        SELECT id, Latitude, Longitude FROM locations
+        {where_sql} id IN ({RTREE_BBOX})
+        ORDER BY id
+    """, params).fetchall()
+
+    cand = np.array(cand, dtype=np.float64).reshape(-1, 3)
+    dist = haversine_km_array(lat, lon, cand[:, 1], cand[:, 2])
+    in_range = dist <= km
+    total = int(in_range.sum())
+    if after is not None:
+        after_d, after_id = after
+        in_range &= (dist > after_d) | ((dist == after_d) & (cand[:, 0] > after_id))
+    keep = np.flatnonzero(in_range)
+    top = keep[smallest(dist[keep], len(keep) if limit is None else limit)]
+    return cand[top, 0].astype(np.int64), dist[top], total
+
+# Total counts per (filters, database state); a write changes the
+# signature, so stale entries are never looked up again
+count_cache = TTLCache(maxsize=512, ttl=300)
+
+def encode_cursor(state):
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return state if isinstance(state, dict) else None
+
+def cursor_fields_ok(after, by_distance):
+    """Whether a decoded cursor has the keys (and types) its sort mode reads."""
+    if not isinstance(after.get("id"), int) or isinstance(after["id"], bool):
+        return False
+    if by_distance:
+        d = after.get("d")
+        return isinstance(d, (int, float)) and not isinstance(d, bool) and isfinite(d)
+    return "v" in after and (after["v"] is None or isinstance(after["v"], (int, float, str)))
+
+def keyset_after(col, order, value, last_id):
+    """
+    WHERE clause for rows strictly after (value, last_id) in
+    ``ORDER BY col {order}, id {order}``. SQLite puts NULLs first when
+    ascending and last when descending.
+    """
+    if col == "id":
+        return ("id > :after_id" if order == "asc" else "id < :after_id"), {"after_id": last_id}
+    params = {"after_id": last_id, "after_value": value}
+    if order == "asc":
+        if value is None:
+            return f"(({col} IS NULL AND id > :after_id) OR {col} IS NOT NULL)", params
+        return f"({col} > :after_value OR ({col} = :after_value AND id > :after_id))", params
+    if value is None:
+        return f"({col} IS NULL AND id < :after_id)", params
+    return (f"({col} < :after_value OR ({col} = :after_value AND id < :after_id)"
+            f" OR {col} IS NULL)"), params
 
 @app.get("/locations")
 def list_locations():
@@ -46,10 +173,9 @@ def list_locations():
     lat = request.args.get("lat", type=float)
     lon = request.args.get("lon", type=float)
     max_km = request.args.get("max_km_from", type=float)
+    include_total = request.args.get("include_total", "").lower() in {"1", "true", "yes"}
 
     limit = min(max(request.args.get("limit", default=50, type=int), 1), 200)
-    page = max(request.args.get("page", default=1, type=int), 1)
-    offset = (page - 1) * limit
 
     sort = request.args.get("sort", default="id")
     order = request.args.get("order", default="asc").lower()
@@ -59,75 +185,93 @@ def list_locations():
     where = []
     params = {}
 
-    if q:
-        where.append("address LIKE :q")
-        params["q"] = f"%{q}%"
+    if q and len(q) >= FTS_MIN_CHARS:
+        where.append("id IN (SELECT rowid FROM locations_fts WHERE locations_fts MATCH :q)")
+        # the trigram index is case-insensitive, so case doesn't change the result set
+        params["q"] = fts_phrase(q.lower())
+    elif q:
+        where.append("Address LIKE :q ESCAPE '\\'")
+        params["q"] = f"%{like_escape(q.lower())}%"
     if min_score is not None:
         where.append("solar_score >= :min_score")
         params["min_score"] = min_score
     if max_slope is not None:
-        where.append("slope <= :max_slope")
+        where.append("tilt_deg <= :max_slope")
         params["max_slope"] = max_slope
     if min_ghi is not None:
-        where.append("annual_ghi >= :min_ghi")
+        where.append("Annual_GHI >= :min_ghi")
         params["min_ghi"] = min_ghi
 
-    # Distance prefilter
-    bbox_sql = ""
-    if (lat is not None) and (lon is not None) and (max_km is not None):
-        lat_min, lat_max, lon_min, lon_max = bbox(lat, lon, max_km * 1.2)
-        bbox_sql = " AND latitude BETWEEN :lat_min AND :lat_max AND longitude BETWEEN :lon_min AND :lon_max"
-        params.update({"lat_min": lat_min, "lat_max": lat_max, "lon_min": lon_min, "lon_max": lon_max})
+    by_distance = (lat is not None) and (lon is not None) and (max_km is not None)
+    # Normalized filters; a cursor is only valid for the query that made it
+    filters = sorted(params.items())
+    if by_distance:
+        filters.append(("near", [lat, lon, max_km]))
+    else:
+        filters.append(("sort", [sort, order]))
+    signature = hashlib.sha1(json.dumps(filters).encode()).hexdigest()[:12]
 
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        after = decode_cursor(cursor)
+        if (after is None or after.get("f") != signature
+                or not cursor_fields_ok(after, by_distance)):
+            return jsonify({"error": "invalid cursor"}), 400
 
-    # 1) Total row count (for pagination metadata)
-    count_sql = f"SELECT COUNT(*) FROM locations {where_sql} {bbox_sql}"
+    total_rows = None
     with db() as con:
-        total_rows = con.execute(count_sql, params).fetchone()[0]
-
-    total_pages = math.ceil(total_rows / limit) if total_rows > 0 else 1
-
-    # If page is out of range → return empty items (O1)
-    if page > total_pages:
-        return jsonify({
-            "page": page,
-            "limit": limit,
-            "total_rows": total_rows,
-            "total_pages": total_pages,
-            "items": []
-        })
-
-    # 2) Paged query
-    sql = f"""
-        SELECT id, address, latitude, longitude, annual_ghi, annual_tilt,
-               grid_distance, solar_score, area, slope, solar_day_length
-        FROM locations
-        {where_sql} {bbox_sql}
-        ORDER BY {sort} {order}
-        LIMIT :limit OFFSET :offset
-    """
-    params.update({"limit": limit, "offset": offset})
-
-    with db() as con:
-        rows = con.execute(sql, params).fetchall()
+        if by_distance:
+            # Exact distance filter over all candidates, ordered by (distance, id)
+            ids, dists, total_rows = within_km(con, lat, lon, max_km, " AND ".join(where),
+                                               params, after=after and (after["d"], after["id"]),
+                                               limit=limit + 1)
+            more = len(ids) > limit
+            ids, dists = ids[:limit], dists[:limit]
+            data = rows_by_id(con, ids)
+            dist_of = dict(zip(ids.tolist(), dists.tolist()))
+            for r in data:
+                r["distance_km"] = dist_of[r["id"]]
+            last = {"d": float(dists[-1]), "id": int(ids[-1])} if more else None
+        else:
+            col = COLUMNS[sort]
+            page_where = list(where)
+            page_params = dict(params)
+            if after is not None:
+                clause, extra = keyset_after(col, order, after["v"], after["id"])
+                page_where.append(clause)
+                page_params.update(extra)
+            page_sql = ("WHERE " + " AND ".join(page_where)) if page_where else ""
+            page_params["limit"] = limit + 1
+            rows = con.execute(f"""
+                SELECT {LIST_COLUMNS}
+                FROM locations
+                {page_sql}
+                ORDER BY {col} {order}, id {order}
+                LIMIT :limit
+            """, page_params).fetchall()
+            more = len(rows) > limit
+            data = [dict(r) for r in rows[:limit]]
+            last = {"v": data[-1][sort], "id": data[-1]["id"]} if more else None
 
-    data = [dict(r) for r in rows]
+            if include_total:
+                key = (signature, db_signature(DB_PATH))
+                total_rows = count_cache.get(key)
+                if total_rows is None:
+                    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+                    total_rows = con.execute(
+                        f"SELECT COUNT(*) FROM locations {where_sql}", params).fetchone()[0]
+                    count_cache.set(key, total_rows)
 
-    # Final distance filter + sort
-    if (lat is not None) and (lon is not None) and (max_km is not None):
-        for r in data:
-            r["distance_km"] = haversine_km(lat, lon, r["latitude"], r["longitude"])
-        data = [r for r in data if r["distance_km"] <= max_km]
-        data.sort(key=lambda x: x["distance_km"])
-
-    return jsonify({
-        "page": page,
+    body = {
         "limit": limit,
-        "total_rows": total_rows,
-        "total_pages": total_pages,
-        "items": data
-    })
+        "items": data,
+        "next_cursor": encode_cursor({"f": signature, **last}) if last else None,
+    }
+    if include_total:
+        body["total_rows"] = total_rows
+        body["total_pages"] = math.ceil(total_rows / limit) if total_rows > 0 else 1
+    return jsonify(body)
 
 @app.get("/locations/<int:loc_id>")
 def get_location(loc_id):
@@ -141,14 +285,28 @@ def get_location(loc_id):
 def search_locations():
     q = request.args.get("q","")
     limit = min(max(request.args.get("limit", default=50, type=int), 1), 200)
+    columns = ("l.id, l.Address AS address, l.Latitude AS latitude, "
+               "l.Longitude AS longitude, l.solar_score")
     with db() as con:
-        rows = con.execute("""
-            SELECT id, address, latitude, longitude, solar_score
-            FROM locations
-            WHERE address LIKE ?
-            ORDER BY id ASC
-            LIMIT ?
-        """, (f"%{q}%", limit)).fetchall()
+        if len(q) >= FTS_MIN_CHARS:
+            # Addresses starting with q first, then by bm25 relevance
+            rows = con.execute(f"""
+                SELECT {columns}
+                FROM locations_fts AS f JOIN locations AS l ON l.id = f.rowid
+                WHERE locations_fts MATCH :match
+                ORDER BY l.Address LIKE :prefix ESCAPE '\\' DESC, bm25(locations_fts), l.id
+                LIMIT :limit
+            """, {"match": fts_phrase(q), "prefix": like_escape(q) + "%",
+                  "limit": limit}).fetchall()
+        else:
+            rows = con.execute(f"""
+                SELECT {columns}
+                FROM locations AS l
+                WHERE l.Address LIKE :pattern ESCAPE '\\'
+                ORDER BY l.Address LIKE :prefix ESCAPE '\\' DESC, l.id ASC
+                LIMIT :limit
+            """, {"pattern": f"%{like_escape(q)}%", "prefix": like_escape(q) + "%",
+                  "limit": limit}).fetchall()
     return jsonify([dict(r) for r in rows])
 
 @app.get("/locations/nearest")
@@ -159,22 +317,28 @@ def nearest():
     if lat is None or lon is None:
         return jsonify({"error":"lat and lon required"}), 400
 
-    # prefilter ~25 km box
-    lat_min, lat_max, lon_min, lon_max = bbox(lat, lon, 25.0)
+    # Exact k nearest at any distance from the in-memory BallTree
+    ids, dists = geo_index.nearest(lat, lon, limit)
+    if len(ids) == 0:
+        return jsonify([])
+
+    placeholders = ",".join("?" * len(ids))
     with db() as con:
-        rows = con.execute("""
-            SELECT id, address, latitude, longitude, solar_score
+        rows = con.execute(f"""
+            SELECT id, Address AS address, Latitude AS latitude,
+                   Longitude AS longitude, solar_score
             FROM locations
-            WHERE latitude BETWEEN ? AND ?
-              AND longitude BETWEEN ? AND ?
-            LIMIT 1000
-        """, (lat_min, lat_max, lon_min, lon_max)).fetchall()
+            WHERE id IN ({placeholders})
+        """, [int(i) for i in ids]).fetchall()
 
-    data = [dict(r) for r in rows]
-    for r in data:
-        r["distance_km"] = haversine_km(lat, lon, r["latitude"], r["longitude"])
-    data.sort(key=lambda x: x["distance_km"])
-    return jsonify(data[:limit])
+    by_id = {r["id"]: dict(r) for r in rows}
+    data = []
+    for i, d in zip(ids, dists):
+        r = by_id.get(int(i))
+        if r is not None:
+            r["distance_km"] = float(d)
+            data.append(r)
+    return jsonify(data)
 
 @app.get("/locations/radius")
 def radius():
@@ -184,25 +348,49 @@ def radius():
     if lat is None or lon is None or km is None:
         return jsonify({"error":"lat, lon, km required"}), 400
 
-    lat_min, lat_max, lon_min, lon_max = bbox(lat, lon, km * 1.2)
     with db() as con:
-        rows = con.execute("""
-            SELECT id, address, latitude, longitude, solar_score
-            FROM locations
-            WHERE latitude BETWEEN ? AND ?
-              AND longitude BETWEEN ? AND ?
-            LIMIT 5000
-        """, (lat_min, lat_max, lon_min, lon_max)).fetchall()
-
-    data = [dict(r) for r in rows]
-    out = []
+        ids, dists, _ = within_km(con, lat, lon, km, limit=5000)
+        data = rows_by_id(con, ids, "id, Address AS address, Latitude AS latitude, "
+                                    "Longitude AS longitude, solar_score")
+    dist_of = dict(zip(ids.tolist(), dists.tolist()))
     for r in data:
-        d = haversine_km(lat, lon, r["latitude"], r["longitude"])
-        if d <= km:
-            r["distance_km"] = d
-            out.append(r)
-    out.sort(key=lambda x: x["distance_km"])
-    return jsonify(out)
+        r["distance_km"] = dist_of[r["id"]]
+    return jsonify(data)
+
+@app.get("/substations/nearest")
+def nearest_substations():
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    limit = min(max(request.args.get("limit", default=5, type=int), 1), 200)
+    max_km = request.args.get("max_km", type=float)
+    if lat is None or lon is None:
+        return jsonify({"error":"lat and lon required"}), 400
+
+    # Distance to grid from the substations table loaded by osm_ingest.py
+    ids, dists = substation_index.nearest(lat, lon, limit)
+    if max_km is not None:
+        keep = dists <= max_km
+        ids, dists = ids[keep], dists[keep]
+    if len(ids) == 0:
+        return jsonify([])
+
+    placeholders = ",".join("?" * len(ids))
+    with db() as con:
+        rows = con.execute(f"""
+            SELECT id, osm_id, type, name, voltage, operator,
+                   lat AS latitude, lon AS longitude
+            FROM substations
+            WHERE id IN ({placeholders})
+        """, [int(i) for i in ids]).fetchall()
+
+    by_id = {r["id"]: dict(r) for r in rows}
+    data = []
+    for i, d in zip(ids, dists):
+        r = by_id.get(int(i))
+        if r is not None:
+            r["distance_km"] = float(d)
+            data.append(r)
+    return jsonify(data)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,255 @@
+"""
+Shared asyncio HTTP plumbing for the data-ingestion scripts.
+
+One ``httpx.AsyncClient`` (connection pool) per run, a token bucket that
+keeps the request rate inside an API's quota, bounded concurrency, and
+retries with exponential backoff for throttling, server errors and
+network failures.
+
+    python async_http.py
+
+checks the retries, Retry-After handling and dataextraction.py's resume
+against a local stand-in server.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` acquisitions per second on average, with bursts of up
+    to ``capacity``. Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+def make_client(concurrency: int, timeout: float = 30.0) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def get_with_retries(client: httpx.AsyncClient, url: str, params=None,
+                           bucket: Optional[TokenBucket] = None, retries: int = 5,
+                           backoff: float = 1.0, max_backoff: float = 60.0) -> httpx.Response:
+    """
+    GET ``url``, waiting for a token before every attempt. Retries on
+    RETRY_STATUSES (honouring Retry-After) and transport errors; returns
+    the last response, or raises the last transport error.
+    """
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            await bucket.acquire()
+        try:
+            resp = await client.get(url, params=params)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+            delay = None
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                return resp
+            delay = _retry_after(resp)
+
+        if delay is None:
+            # Full jitter so retries from many workers don't line up
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+        await asyncio.sleep(delay)
+
+
+async def map_bounded(func: Callable[[T], Awaitable[R]], items: Iterable[T],
+                      concurrency: int) -> AsyncIterator[R]:
+    """
+    Run ``func`` over ``items`` with at most ``concurrency`` calls in
+    flight, yielding results as they complete (not in input order).
+    Items are pulled lazily, so memory stays bounded.
+    """
+    items = iter(items)
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    done = object()
+
+    async def worker():
+        try:
+            for item in items:
+                await results.put(await func(item))
+        finally:
+            await results.put(done)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        remaining = len(workers)
+        while remaining:
+            result = await results.get()
+            if result is done:
+                remaining -= 1
+            else:
+                yield result
+    finally:
+        for w in workers:
+            w.cancel()
+        # Surface a worker's exception instead of swallowing it
+        for w in workers:
+            try:
+                await w
+            except asyncio.CancelledError:
+                pass
+
+
+# --- Local stand-in server for the __main__ checks ---
+
+Reply = Tuple[int, Dict[str, str], object]
+
+
+def stand_in_server(respond: Callable[[str, Dict[str, str]], Reply]) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Serve GETs on a free local port from ``respond(path, params)``, which
+    returns (status, headers, JSON body). Returns the server (call
+    ``shutdown()`` when done) and its base URL.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, headers, body = respond(url.path, dict(parse_qsl(url.query)))
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            for name, value in {"Content-Type": "application/json", **headers}.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    from collections import Counter
+
+    import dataextraction
+
+    hits: Counter = Counter()
+    down = {"lat": "1.0"}
+
+    def respond(path, params):
+        hits[path] += 1
+        n = hits[path]
+        if path == "/flaky":
+            return (503, {}, {}) if n <= 2 else (200, {}, {"ok": True})
+        if path == "/throttled":
+            return (429, {"Retry-After": "0.3"}, {}) if n == 1 else (200, {}, {"ok": True})
+        if path == "/down":
+            return 503, {"Retry-After": "0"}, {}
+        if path == dataextraction.PATH:
+            if params["lat"] == down["lat"]:
+                return 429, {"Retry-After": "0"}, {"errors": ["rate limited"]}
+            return 200, {}, {"outputs": {"avg_ghi": {"annual": 5.0, "monthly": {"jan": 3.0}},
+                                         "avg_dni": {"annual": 6.0},
+                                         "avg_lat_tilt": {"annual": 5.5}}}
+        return 404, {}, {"errors": ["not found"]}
+
+    server, base = stand_in_server(respond)
+
+    async def check_retries():
+        async with make_client(4) as client:
+            async def get(path, **kw):
+                return await get_with_retries(client, base + path, backoff=0.01, **kw)
+
+            resp = await get("/flaky")
+            assert resp.status_code == 200 and hits["/flaky"] == 3, "5xx is retried until it succeeds"
+
+            t = time.perf_counter()
+            resp = await get("/throttled")
+            waited = time.perf_counter() - t
+            assert resp.status_code == 200 and hits["/throttled"] == 2, "429 is retried"
+            assert waited >= 0.3, f"Retry-After honoured (waited {waited:.2f} s)"
+
+            resp = await get("/missing")
+            assert resp.status_code == 404 and hits["/missing"] == 1, "4xx is not retried"
+
+            resp = await get("/down", retries=2)
+            assert resp.status_code == 503 and hits["/down"] == 3, "last response after the retries"
+
+            closed = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+            dead = f"http://127.0.0.1:{closed.server_address[1]}/"
+            closed.server_close()
+            try:
+                await get_with_retries(client, dead, retries=1, backoff=0.01)
+            except httpx.TransportError:
+                pass
+            else:
+                raise AssertionError("transport errors are raised after the retries")
+
+    async def check_resume(output):
+        rows = [(f"{i} Main St", f"{i}.0", "-100.0") for i in range(4)]
+        kw = dict(base_url=base, rate=100, burst=4, concurrency=2)
+
+        # One address stays throttled: it is recorded with an Error ...
+        await dataextraction.fetch_all(rows, output, "KEY", **kw)
+        done = dataextraction.done_addresses(output)
+        assert done == {"0 Main St", "2 Main St", "3 Main St"}, done
+
+        # ... and is the only one a rerun asks for again
+        down["lat"] = None
+        before = hits[dataextraction.PATH]
+        todo = [r for r in rows if r[0] not in done]
+        await dataextraction.fetch_all(todo, output, "KEY", **kw)
+        assert hits[dataextraction.PATH] - before == 1, "rerun only refetches the failed row"
+        assert dataextraction.done_addresses(output) == {r[0] for r in rows}
+
+    try:
+        asyncio.run(check_retries())
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(check_resume(os.path.join(tmp, "results.csv")))
+    except AssertionError as e:
+        sys.exit(f"❌ {e}")
+    finally:
+        server.shutdown()
+    print(f"✅ Retries, Retry-After and resume behave ({sum(hits.values())} stand-in requests)")
@@ -0,0 +1,151 @@
+"""
+Content-addressed on-disk cache of rendered forecast charts.
+
+A chart is fully determined by (render version, state, years_ahead, model
+fingerprint, data fingerprint), so the SHA-256 of that tuple names the PNG
+file and doubles as its ETag. The directory is kept under a byte budget by evicting the least
+recently served files.
+
+    python chart_cache.py [--horizons 5 10 25 50 100] [--workers N]
+
+pre-renders every state at the given horizons from the materialized
+forecast table (run it after predictionModel.py).
+"""
+import argparse
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+BASE_DIR = Path(__file__).parent
+CACHE_DIR = BASE_DIR / 'data' / '.chart_cache'
+MODELS_DIR = BASE_DIR / 'models'
+CHART_CACHE_MAX_BYTES = int(os.environ.get(
+    'CHART_CACHE_MAX_MB', 256)) * 1024 * 1024
+
+COMMON_HORIZONS = (5, 10, 25, 50, 100)
+
+
+# Bump whenever chart_renderer's figure template or render_png output
+# changes, so cached PNGs and their ETags are not served for the old look
+CHART_RENDER_VERSION = 1
+
+
+def chart_key(state: str, years_ahead: int, model_fingerprint: str, data_fingerprint: str) -> str:
+    raw = f"v{CHART_RENDER_VERSION}|{state}|{years_ahead}|{model_fingerprint}|{data_fingerprint}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ChartDiskCache:
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = CHART_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.total_bytes = sum(p.stat().st_size for p in self.directory.glob('*.png'))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f'{key}.png'
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as "last served" for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp = path.with_suffix(f'.tmp{os.getpid()}.{threading.get_ident()}')
+        tmp.write_bytes(data)
+        with self._lock:
+            existed = path.exists()
+            os.replace(tmp, path)
+            if not existed:
+                self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = []
+        for p in self.directory.glob('*.png'):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        # Evict down to 90% so we don't run this on every put
+        target = self.max_bytes * 0.9
+        for _, size, p in files:
+            if total <= target:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+        self.total_bytes = total
+
+    def stats(self) -> dict:
+        return {"directory": str(self.directory), "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes}
+
+
+def current_fingerprints():
+    from ttl_cache import file_fingerprint
+    from energy_features import DATA_CSV
+
+    models = [MODELS_DIR / f'{name}.joblib' for name in ('clf', 'reg_renew', 'reg_nonrenew')]
+    return file_fingerprint(*models), file_fingerprint(DATA_CSV)
+
+
+def prewarm(horizons=COMMON_HORIZONS, workers: Optional[int] = None) -> int:
+    """Render every state x horizon that isn't cached yet. Returns the count."""
+    from chart_renderer import CHART_WORKERS, _init_worker, render_png
+    from energy_features import DATA_CSV
+    from forecast_table import load_forecast_table
+
+    model_fp, data_fp = current_fingerprints()
+    forecasts = load_forecast_table(MODELS_DIR / 'forecasts.db', model_fp, data_fp)
+    if not forecasts:
+        raise SystemExit("No up-to-date forecast table; run predictionModel.py first")
+
+    cache = ChartDiskCache()
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers or CHART_WORKERS,
+                             initializer=_init_worker, initargs=(str(DATA_CSV),)) as pool:
+        futures = {}
+        for state, trajectory in forecasts.items():
+            for h in horizons:
+                key = chart_key(state, h, model_fp, data_fp)
+                if cache.contains(key) or h > len(trajectory):
+                    continue
+                fc = trajectory.iloc[:h]
+                futures[pool.submit(render_png, state, h, fc['Year'].tolist(),
+                                    fc['Pred_PercentRenewable'].tolist(),
+                                    fc['Pred_PercentNonRenewable'].tolist())] = key
+        for future in as_completed(futures):
+            cache.put(futures[future], future.result())
+            rendered += 1
+    return rendered
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-render forecast charts into the disk cache")
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(COMMON_HORIZONS))
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    n = prewarm(args.horizons, args.workers)
+    print(f"✅ Rendered {n} charts into {CACHE_DIR}")
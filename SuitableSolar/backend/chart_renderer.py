@@ -0,0 +1,163 @@
+"""
+Forecast chart rendering off the event loop.
+
+Charts are drawn in a small pool of worker processes. Each worker sets up
+matplotlib, maps the feature table and builds a figure template once, then
+only swaps line data per request. ``ChartRenderer`` caps the number of
+queued renders (callers get ``RendererBusy`` beyond that) and lets identical
+concurrent requests share a single render. If a worker dies, the pool is
+replaced and the render retried once.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Hashable, Optional, Sequence
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+from energy_features import DATA_CSV, load_features  # noqa: E402
+
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(4, os.cpu_count() or 1)))
+CHART_QUEUE_LIMIT = int(os.environ.get('CHART_QUEUE_LIMIT', CHART_WORKERS * 4))
+
+
+class RendererBusy(Exception):
+    pass
+
+
+# --- Worker side ---
+
+_template = None
+
+
+# Changing the template or render_png? Bump chart_cache.CHART_RENDER_VERSION.
+def _init_worker(csv_path):
+    global _template
+    load_features(csv_path)
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    lines = {
+        'hist_renew': ax.plot([], [], label='Historical Percent Renewable', color='blue')[0],
+        'fc_renew': ax.plot([], [], label='Forecasted Percent Renewable', color='blue', linestyle='--')[0],
+        'hist_nonrenew': ax.plot([], [], label='Historical Percent Nonrenewable', color='orange')[0],
+        'fc_nonrenew': ax.plot([], [], label='Forecasted Percent Nonrenewable', color='orange', linestyle='--')[0],
+    }
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Percent Energy')
+    ax.set_xlim(left=1960, right=2130)
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    _template = (csv_path, fig, ax, lines)
+
+
+def _warm():
+    return os.getpid()
+
+
+def render_png(state: str, years_ahead: int, forecast_years: Sequence[int],
+               forecast_renew: Sequence[float], forecast_nonrenew: Sequence[float]) -> bytes:
+    """Same chart as forecast_chart.create_forecast_figure, as PNG bytes."""
+    csv_path, fig, ax, lines = _template
+    # A stat per call; the table is re-mapped if the CSV was replaced
+    hist = load_features(csv_path).state_frame(state)
+
+    lines['hist_renew'].set_data(hist['Year'], hist['PercentRenewable'])
+    lines['hist_nonrenew'].set_data(hist['Year'], hist['PercentNonRenewable'])
+    lines['fc_renew'].set_data(forecast_years, forecast_renew)
+    lines['fc_nonrenew'].set_data(forecast_years, forecast_nonrenew)
+    ax.set_title(f'Energy Forecast for {state} ({years_ahead} Years Ahead)')
+    ax.relim()
+    ax.autoscale_view(scalex=False)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return buf.getvalue()
+
+
+# --- Server side ---
+
+class ChartRenderer:
+    def __init__(self, workers: int = CHART_WORKERS, queue_limit: int = CHART_QUEUE_LIMIT,
+                 csv_path=DATA_CSV):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.csv_path = csv_path
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.restarts = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def start(self, warm: bool = True):
+        # spawn, not fork: the server process has running threads
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(str(self.csv_path),),
+        )
+        if warm:
+            # Start every worker now so the first requests don't pay for it
+            for f in [self.pool.submit(_warm) for _ in range(self.workers)]:
+                f.result()
+
+    async def start_async(self, warm: bool = True):
+        """``start`` on a thread, so warming the workers doesn't block the event loop."""
+        await asyncio.get_running_loop().run_in_executor(None, self.start, warm)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._inflight)
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        # Several renders can see the same broken pool; only the first replaces it
+        if self.pool is pool:
+            self.pool = None
+            self.restarts += 1
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _render(self, *args) -> bytes:
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            if self.pool is None:
+                self.start(warm=False)
+            pool = self.pool
+            try:
+                return await loop.run_in_executor(pool, render_png, *args)
+            except BrokenProcessPool:
+                # A worker died (OOM kill, segfault); every later submit to
+                # this pool would fail, so start a fresh one and retry once
+                self._discard(pool)
+                if attempt:
+                    raise
+
+    async def render(self, key: Hashable, *args) -> bytes:
+        """
+        Render ``render_png(*args)`` in the pool. Concurrent calls with the
+        same key await the same render. Raises RendererBusy when the queue
+        is full. If the pool broke, it is rebuilt and the render retried once.
+        """
+        shared = self._inflight.get(key)
+        if shared is not None:
+            return await asyncio.shield(shared)
+
+        if self.pending >= self.queue_limit:
+            raise RendererBusy()
+
+        future = asyncio.ensure_future(self._render(*args))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "queue_limit": self.queue_limit,
+                "pending": self.pending, "restarts": self.restarts}
@@ -1,6 +1,101 @@
+import argparse
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+
 import pandas as pd
 import numpy as np
 
+MONTH_COLS = ["GHI_jan", "GHI_feb", "GHI_mar", "GHI_apr", "GHI_may", "GHI_jun",
+              "GHI_jul", "GHI_aug", "GHI_sep", "GHI_oct", "GHI_nov", "GHI_dec"]
+SCORE_INPUTS = ["Annual_GHI", "Annual_Tilt_Latitude", "Latitude", "tilt_deg",
+                "nearest_substation_km", "acres", "price"] + MONTH_COLS
+
+FACTORS = ["irradiance", "stability", "latitude", "tilt", "distance", "value"]
+WEIGHTS = [0.25, 0.10, 0.20, 0.15, 0.10, 0.20]
+
+CHUNKSIZE = 100_000
+
+
+def compute_normalizers(chunks: Iterable[pd.DataFrame]) -> Dict[str, float]:
+    """
+    Dataset-wide min/max values the score is normalized by, accumulated
+    chunk by chunk. Same NaN/inf handling as pandas min()/max() on the
+    whole column.
+    """
+    min_ghi = max_ghi = max_value_efficiency = np.nan
+    for chunk in chunks:
+        # fmin/fmax skip NaN like pandas does
+        min_ghi = np.fmin(min_ghi, chunk["Annual_GHI"].min())
+        max_ghi = np.fmax(max_ghi, chunk["Annual_GHI"].max())
+        max_value_efficiency = np.fmax(max_value_efficiency,
+                                       (chunk["acres"] / chunk["price"]).max())
+    return {"min_ghi": min_ghi, "max_ghi": max_ghi,
+            "max_value_efficiency": max_value_efficiency}
+
+
+def factor_matrix(df: pd.DataFrame, norms: Dict[str, float]) -> np.ndarray:
+    """
+    The six normalized score factors (columns in FACTORS order) for every
+    row of ``df``, as column operations.
+    """
+    min_ghi, max_ghi = norms["min_ghi"], norms["max_ghi"]
+    max_value_efficiency = norms["max_value_efficiency"]
+
+    def col(name):
+        return df[name].to_numpy(dtype=float)
+
+    months = df[MONTH_COLS].to_numpy(dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 1️⃣ Irradiance Strength (normalized)
+        irradiance = (col("Annual_GHI") + col("Annual_Tilt_Latitude")) / 2
+        normalized_irr = (irradiance - min_ghi) / \
+            (max_ghi - min_ghi) if max_ghi != min_ghi else 1
+
+        # 2️⃣ Seasonal Stability
+        mean_ghi = np.mean(months, axis=1)
+        stdev_ghi = np.std(months, axis=1)
+        stability = np.where(mean_ghi != 0, 1 - (stdev_ghi / mean_ghi), 0)
+
+        # 3️⃣ Latitude Adjustment
+        lat_factor = 1 - (np.abs(col("Latitude")) / 90) * 0.3
+
+        # 4️⃣ Tilt Factor
+        tilt_factor = np.exp(-np.abs(col("tilt_deg")) / 10)
+
+        # 5️⃣ Substation Distance Factor
+        distance_factor = np.exp(-col("nearest_substation_km") / 15)
+
+        # 6️⃣ Land Value Efficiency (acres per price)
+        price = col("price")
+        value_efficiency = np.where(price > 0, col("acres") / price, 0)
+        value_factor = value_efficiency / \
+            max_value_efficiency if max_value_efficiency != 0 else 1
+
+    factors = np.empty((len(df), len(FACTORS)))
+    for i, factor in enumerate([normalized_irr, stability, lat_factor,
+                                tilt_factor, distance_factor, value_factor]):
+        factors[:, i] = factor
+    return factors
+
+
+def score_rows(df: pd.DataFrame, norms: Dict[str, float]) -> np.ndarray:
+    """Solar Suitability Score (0–100) for every row of ``df``."""
+    f = factor_matrix(df, norms)
+
+    # Combine (weighted), adding in the same order as the reference
+    score = ((f[:, 0] * WEIGHTS[0]) +      # 25%
+             (f[:, 1] * WEIGHTS[1]) +      # 10%
+             (f[:, 2] * WEIGHTS[2]) +      # 20%
+             (f[:, 3] * WEIGHTS[3]) +      # 15%
+             (f[:, 4] * WEIGHTS[4]) +      # 10%
+             (f[:, 5] * WEIGHTS[5])) * 100  # 20%
+
+    return np.clip(score, 0, 100)
+
 
 def compute_solar_suitability(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -9,6 +104,14 @@ def compute_solar_suitability(df: pd.DataFrame) -> pd.DataFrame:
     tilt of the land, proximity to the nearest substation, and land value efficiency (acres per price).
     """
 
+    df.columns = df.columns.str.strip()
+    df["solar_score"] = score_rows(df, compute_normalizers([df]))
+    return df
+
+
+def compute_solar_suitability_reference(df: pd.DataFrame) -> pd.DataFrame:
+    """Original row-by-row implementation, kept to check compute_solar_suitability against."""
+
     df.columns = df.columns.str.strip()
 
     # --- Step 1: Determine min/max for normalization ---
@@ -65,8 +168,93 @@ def compute_solar_suitability(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# --- Streaming: score data that doesn't fit in memory, in two passes ---
+
+def _csv_chunks(path, chunksize: int, usecols=None) -> Iterator[pd.DataFrame]:
+    for chunk in pd.read_csv(path, chunksize=chunksize,
+                             usecols=(lambda c: c.strip() in usecols) if usecols else None):
+        chunk.columns = chunk.columns.str.strip()
+        yield chunk
+
+
+def score_csv(in_path, out_path=None, chunksize: int = CHUNKSIZE) -> int:
+    """
+    Rewrite ``in_path`` (or write ``out_path``) with a fresh solar_score
+    column, holding at most ``chunksize`` rows in memory. Returns the row
+    count.
+    """
+    out_path = Path(out_path or in_path)
+    norms = compute_normalizers(_csv_chunks(in_path, chunksize, usecols=set(SCORE_INPUTS)))
+
+    tmp = out_path.with_name(f"{out_path.name}.tmp{os.getpid()}")
+    rows = 0
+    try:
+        for i, chunk in enumerate(_csv_chunks(in_path, chunksize)):
+            chunk["solar_score"] = score_rows(chunk, norms)
+            chunk.to_csv(tmp, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            rows += len(chunk)
+        os.replace(tmp, out_path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return rows
+
+
+def _sqlite_chunks(con: sqlite3.Connection, chunksize: int, with_id: bool = False) -> Iterator[pd.DataFrame]:
+    # Keyset over id so chunks stay stable while scores are written back
+    cols = (["id"] if with_id else []) + SCORE_INPUTS
+    last_id = -1
+    while True:
+        chunk = pd.read_sql_query(
+            f"SELECT id AS _key, {', '.join(cols)} FROM locations "
+            f"WHERE id > ? ORDER BY id LIMIT ?", con, params=(last_id, chunksize))
+        if chunk.empty:
+            return
+        last_id = int(chunk["_key"].iloc[-1])
+        yield chunk.drop(columns="_key")
+
+
+def score_sqlite(db_path, chunksize: int = CHUNKSIZE) -> int:
+    """Recompute locations.solar_score in place, one chunk per transaction."""
+    rows = 0
+    with closing(sqlite3.connect(db_path)) as con:
+        norms = compute_normalizers(_sqlite_chunks(con, chunksize))
+        for chunk in _sqlite_chunks(con, chunksize, with_id=True):
+            scores = score_rows(chunk, norms)
+            with con:
+                con.executemany(
+                    "UPDATE locations SET solar_score = ? WHERE id = ?",
+                    zip(scores.tolist(), chunk["id"].tolist()))
+            rows += len(chunk)
+    return rows
+
+
+def check_parity(df: pd.DataFrame) -> float:
+    """Largest absolute difference between the vectorized and reference scores."""
+    fast = compute_solar_suitability(df.copy())["solar_score"].to_numpy(dtype=float)
+    ref = compute_solar_suitability_reference(df.copy())["solar_score"].to_numpy(dtype=float)
+    if not np.array_equal(np.isnan(fast), np.isnan(ref)):
+        return np.inf
+    both = ~np.isnan(ref)
+    return float(np.max(np.abs(fast[both] - ref[both]), initial=0.0))
+
+
 if __name__ == "__main__":
-    df = pd.read_csv("backend/data/final_dataset.csv")
-    df = compute_solar_suitability(df)
-    df.to_csv("backend/data/final_dataset.csv", index=False)
-    print("✅ Solar Suitability Scores updated")
+    parser = argparse.ArgumentParser(description="Recompute solar suitability scores")
+    parser.add_argument("--csv", default="backend/data/final_dataset.csv")
+    parser.add_argument("--db", help="score the locations table of this database instead")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--check", action="store_true",
+                        help="only compare against the reference implementation")
+    args = parser.parse_args()
+
+    if args.check:
+        diff = check_parity(pd.read_csv(args.csv))
+        print(f"max |vectorized - reference| = {diff:.3g}")
+        raise SystemExit(0 if diff <= 1e-9 else 1)
+
+    if args.db:
+        n = score_sqlite(args.db, args.chunksize)
+    else:
+        n = score_csv(args.csv, chunksize=args.chunksize)
+    print(f"✅ Solar Suitability Scores updated ({n} rows)")
@@ -1,92 +1,167 @@
+import argparse
+import asyncio
+import csv
+import os
+
 import pandas as pd
-import requests
-import json
-import time
+from dotenv import load_dotenv
 from tqdm import tqdm
 
-# Your API key
-API_KEY = "vR8le25b3vHo6kMP4nsv8HxkFbvDPRkuyQLl5X8n"
+from async_http import TokenBucket, get_with_retries, make_client, map_bounded
 
 # Input / Output paths
 INPUT_FILE = "backend/data/newdata.csv"
 OUTPUT_FILE = "backend/data/solar_results.csv"
 
-# Base URL for NREL Solar Resource API
-URL = "https://developer.nrel.gov/api/solar/solar_resource/v1.json"
-
-# Read geocoded CSV
-df = pd.read_csv(INPUT_FILE)
-
-
-# Prepare result storage
-results = []
-
-print(f"Processing {len(df)} locations...")
-
-# Iterate through each row
-for _, row in tqdm(df.iterrows(), total=len(df)):
-    lat = row["latitude"]
-    lon = row["longitude"]
-    address = row["address"]
-
-    if pd.isna(lat) or pd.isna(lon):
-        print(f"⚠️ Skipping {address} — missing coordinates")
-        continue
-
-    # Prepare request
-    params = {
-        "api_key": API_KEY,
-        "lat": lat,
-        "lon": lon
+# Base URL for NREL Solar Resource API (point NREL_BASE_URL at a local
+# stand-in server for testing)
+BASE_URL = "https://developer.nrel.gov"
+PATH = "/api/solar/solar_resource/v1.json"
+
+# NREL's default per-key quota; raise with --rate if your key allows more
+RATE_PER_SEC = 1.0
+BURST = 1
+CONCURRENCY = 8
+
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun",
+          "jul", "aug", "sep", "oct", "nov", "dec"]
+OUTPUT_COLS = ["Address", "Latitude", "Longitude", "Annual_GHI", "Annual_DNI",
+               "Annual_Tilt_Latitude"] + [f"GHI_{m}" for m in MONTHS] + ["Error"]
+
+
+def parse_outputs(address, lat, lon, status_code, data) -> dict:
+    # Default values
+    ghi_annual = dni_annual = tilt_annual = None
+    ghi_monthly = {}
+
+    if status_code == 200 and isinstance(data, dict) and "outputs" in data \
+            and isinstance(data["outputs"], dict):
+        outputs = data["outputs"]
+
+        if all(k in outputs for k in ("avg_ghi", "avg_dni", "avg_lat_tilt")):
+            ghi_annual = outputs["avg_ghi"].get("annual", None) if isinstance(
+                outputs["avg_ghi"], dict) else None
+            dni_annual = outputs["avg_dni"].get("annual", None) if isinstance(
+                outputs["avg_dni"], dict) else None
+            tilt_annual = outputs["avg_lat_tilt"].get("annual", None) if isinstance(
+                outputs["avg_lat_tilt"], dict) else None
+            ghi_monthly = outputs["avg_ghi"].get(
+                "monthly", {}) if isinstance(outputs["avg_ghi"], dict) else {}
+
+    row = {
+        "Address": address,
+        "Latitude": lat,
+        "Longitude": lon,
+        "Annual_GHI": ghi_annual,
+        "Annual_DNI": dni_annual,
+        "Annual_Tilt_Latitude": tilt_annual,
+        **{f"GHI_{m}": v for m, v in ghi_monthly.items()}
     }
+    if status_code != 200:
+        # Marked as an error so done_addresses retries it on the next run
+        errors = data.get("errors") if isinstance(data, dict) else None
+        row["Error"] = f"HTTP {status_code}" + (f": {'; '.join(map(str, errors))}" if errors else "")
+    return row
+
 
+def done_addresses(output_file) -> set:
+    """Addresses already fetched without error, so a rerun resumes."""
+    if not os.path.exists(output_file):
+        return set()
     try:
-        response = requests.get(URL, params=params)
-        data = response.json()
-
-        # Default values
-        ghi_annual = dni_annual = tilt_annual = None
-        ghi_monthly = {}
-
-        if response.status_code == 200 and "outputs" in data and isinstance(data["outputs"], dict):
-            outputs = data["outputs"]
-
-            if all(k in outputs for k in ("avg_ghi", "avg_dni", "avg_lat_tilt")):
-                ghi_annual = outputs["avg_ghi"].get("annual", None) if isinstance(
-                    outputs["avg_ghi"], dict) else None
-                dni_annual = outputs["avg_dni"].get("annual", None) if isinstance(
-                    outputs["avg_dni"], dict) else None
-                tilt_annual = outputs["avg_lat_tilt"].get("annual", None) if isinstance(
-                    outputs["avg_lat_tilt"], dict) else None
-                ghi_monthly = outputs["avg_ghi"].get(
-                    "monthly", {}) if isinstance(outputs["avg_ghi"], dict) else {}
-
-        # Store result
-        results.append({
-            "Address": address,
-            "Latitude": lat,
-            "Longitude": lon,
-            "Annual_GHI": ghi_annual,
-            "Annual_DNI": dni_annual,
-            "Annual_Tilt_Latitude": tilt_annual,
-            **{f"GHI_{m}": v for m, v in ghi_monthly.items()}
-        })
-
-        # Be nice to API
-        time.sleep(1)
-
-    except Exception as e:
-        print(f"❌ Error for {address}: {e}")
-        results.append({
-            "Address": address,
-            "Latitude": lat,
-            "Longitude": lon,
-            "Error": str(e)
-        })
-        time.sleep(1)
-
-# Convert to DataFrame and export
-result_df = pd.DataFrame(results)
-result_df.to_csv(OUTPUT_FILE, index=False)
-
-print(f"\n✅ Done! Results saved to: {OUTPUT_FILE}")
+        prev = pd.read_csv(output_file)
+    except pd.errors.EmptyDataError:
+        return set()
+    if "Address" not in prev.columns:
+        return set()
+    if "Error" not in prev.columns:
+        # Older outputs only had the column when an exception happened;
+        # failed responses show up there as rows without data
+        ok = prev["Annual_GHI"].notna() if "Annual_GHI" in prev.columns else True
+        return set(prev.loc[ok, "Address"])
+    return set(prev.loc[prev["Error"].isna(), "Address"])
+
+
+def upgrade_output(output_file):
+    """Rewrite an output CSV from an older layout with the current columns."""
+    if not os.path.exists(output_file):
+        return
+    with open(output_file, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), None)
+    if header is not None and header != OUTPUT_COLS:
+        # Appending current-layout rows under another header would misalign them
+        prev = pd.read_csv(output_file)
+        prev.reindex(columns=OUTPUT_COLS).to_csv(output_file, index=False)
+
+
+async def fetch_all(rows, output_file, api_key, base_url=BASE_URL, rate=RATE_PER_SEC,
+                    burst=BURST, concurrency=CONCURRENCY) -> int:
+    """Fetch every (address, lat, lon) and append each result as it arrives."""
+    bucket = TokenBucket(rate, burst)
+    url = base_url.rstrip("/") + PATH
+
+    async with make_client(concurrency) as client:
+        async def fetch(row):
+            address, lat, lon = row
+            try:
+                resp = await get_with_retries(
+                    client, url, {"api_key": api_key, "lat": lat, "lon": lon}, bucket)
+                try:
+                    data = resp.json()
+                except ValueError:
+                    data = None
+                return parse_outputs(address, lat, lon, resp.status_code, data)
+            except Exception as e:
+                return {"Address": address, "Latitude": lat, "Longitude": lon, "Error": str(e)}
+
+        upgrade_output(output_file)
+        new_file = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+        written = 0
+        with open(output_file, "a", newline="", encoding="utf-8") as f, \
+                tqdm(total=len(rows)) as progress:
+            writer = csv.DictWriter(f, fieldnames=OUTPUT_COLS, extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            async for result in map_bounded(fetch, rows, concurrency):
+                if result.get("Error"):
+                    print(f"❌ Error for {result['Address']}: {result['Error']}")
+                writer.writerow(result)
+                f.flush()
+                written += 1
+                progress.update()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch NREL solar resource data for geocoded addresses")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--rate", type=float, default=RATE_PER_SEC, help="requests per second")
+    parser.add_argument("--burst", type=float, default=BURST)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--base-url", default=None)
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("NREL_API_KEY", "DEMO_KEY")
+    base_url = args.base_url or os.getenv("NREL_BASE_URL", BASE_URL)
+
+    # Read geocoded CSV
+    df = pd.read_csv(args.input)
+    skip = done_addresses(args.output)
+
+    rows = []
+    for address, lat, lon in zip(df["address"], df["latitude"], df["longitude"]):
+        if pd.isna(lat) or pd.isna(lon):
+            print(f"⚠️ Skipping {address} — missing coordinates")
+        elif address not in skip:
+            rows.append((address, lat, lon))
+
+    print(f"Processing {len(rows)} locations ({len(skip)} already done)...")
+    n = asyncio.run(fetch_all(rows, args.output, api_key, base_url,
+                              args.rate, args.burst, args.concurrency))
+    print(f"\n✅ Done! {n} results appended to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Shared, read-only SQLite connections for the API processes.
+
+Opening a connection per query repeats the file open, schema parse and
+page-cache warmup every time. ``ReadPool`` keeps a small set of tuned
+read-only connections per database file instead (memory-mapped I/O, a
+larger page cache, ``query_only`` and a prepared-statement cache), hands
+one out per ``with pool.connection() as con:`` block, and replaces them
+when the database file is swapped for a new one. The pool never writes to
+the database, not even its journal mode.
+
+    python db.py [n]
+
+compares a fresh connection per query against the pool.
+"""
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_KIB = 64 * 1024
+CACHED_STATEMENTS = 256
+POOL_SIZE = 8
+
+
+def db_signature(db_path: Path) -> Tuple:
+    """
+    Cheap "has the database changed?" token: mtime and size of the database
+    file and of its WAL file (WAL writes don't touch the main file until a
+    checkpoint).
+    """
+    sig = []
+    for path in (Path(db_path), Path(f"{db_path}-wal")):
+        try:
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def _file_identity(db_path: Path) -> Tuple[int, int]:
+    st = os.stat(db_path)
+    return st.st_dev, st.st_ino
+
+
+def read_only_uri(db_path) -> str:
+    """SQLite URI opening ``db_path`` read-only, with the path percent-escaped."""
+    return Path(db_path).resolve().as_uri() + "?mode=ro"
+
+
+def set_journal_mode(db_path: Path, mode: str) -> str:
+    """
+    Switch the database's journal mode ("wal" or "delete"). WAL lets
+    readers and a writer run without blocking each other, but even
+    read-only opens then need to create -wal/-shm files next to the
+    database, so it's a deliberate migration (``schema.py --wal``), never
+    something the read pool does. Returns the resulting mode.
+    """
+    # Needs the only open connection to the file: close it straight away
+    with closing(sqlite3.connect(db_path)) as con:
+        return con.execute(f"PRAGMA journal_mode={mode}").fetchone()[0]
+
+
+class ReadPool:
+    def __init__(self, db_path: Path, size: int = POOL_SIZE, mmap_size: int = MMAP_SIZE,
+                 cache_kib: int = CACHE_KIB, cached_statements: int = CACHED_STATEMENTS):
+        self.db_path = Path(db_path)
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_kib = cache_kib
+        self.cached_statements = cached_statements
+
+        self._idle: "queue.LifoQueue[Tuple[Tuple[int, int], sqlite3.Connection]]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _open(self) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            read_only_uri(self.db_path), uri=True,
+            check_same_thread=False, cached_statements=self.cached_statements)
+        con.row_factory = sqlite3.Row
+        con.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        con.execute(f"PRAGMA cache_size=-{self.cache_kib}")
+        con.execute("PRAGMA temp_store=MEMORY")
+        con.execute("PRAGMA query_only=ON")
+        # Connections are opened from many request threads at once
+        with self._lock:
+            self.opened += 1
+        return con
+
+    def _current_identity(self) -> Tuple[int, int]:
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"Database not found at {self.db_path}")
+        return _file_identity(self.db_path)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        identity = self._current_identity()
+        con = None
+        while con is None:
+            try:
+                con_identity, idle = self._idle.get_nowait()
+            except queue.Empty:
+                con = self._open()
+                break
+            if con_identity == identity:
+                con = idle
+            else:
+                # Opened against a file that has since been replaced
+                idle.close()
+
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
+            if self._idle.qsize() < self.size:
+                self._idle.put((identity, con))
+            else:
+                con.close()
+
+    def close(self):
+        while True:
+            try:
+                _, con = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            con.close()
+
+
+_pools: Dict[str, ReadPool] = {}
+_pools_lock = threading.Lock()
+
+
+def read_pool(db_path: Path) -> ReadPool:
+    """The process-wide pool for ``db_path``."""
+    key = str(Path(db_path).resolve())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ReadPool(db_path))
+    return pool
+
+
+if __name__ == '__main__':
+    db_path = Path(__file__).with_name('locations.db')
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    ids = [r[0] for r in sqlite3.connect(db_path).execute("SELECT id FROM locations")]
+    sql = "SELECT * FROM locations WHERE id = ?"
+
+    t = time.perf_counter()
+    for i in range(n):
+        con = sqlite3.connect(db_path)
+        con.row_factory = sqlite3.Row
+        con.execute(sql, (ids[i % len(ids)],)).fetchone()
+        con.close()
+    fresh = (time.perf_counter() - t) / n
+
+    pool = read_pool(db_path)
+    t = time.perf_counter()
+    for i in range(n):
+        with pool.connection() as con:
+            con.execute(sql, (ids[i % len(ids)],)).fetchone()
+    pooled = (time.perf_counter() - t) / n
+
+    print(f"row by id, {n} requests: fresh connection {fresh * 1e6:.0f} us, "
+          f"pooled {pooled * 1e6:.0f} us ({fresh / pooled:.1f}x), "
+          f"{pool.opened} connection(s) opened")
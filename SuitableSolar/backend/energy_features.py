@@ -0,0 +1,136 @@
+"""
+Lagged feature frame for the state energy time series, built once.
+
+The diff/lag features are computed from ``state_energy_summary.csv`` a
+single time and saved as .npy arrays under ``data/.feature_cache/<hash>/``,
+where the hash is of the CSV contents. Later loads memory-map those arrays,
+so every consumer (API, charts, training) shares one read-only copy and
+never re-parses the CSV or re-runs the groupby shifts.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from ttl_cache import file_sha
+
+DATA_CSV = Path(__file__).parent / 'data' / 'state_energy_summary.csv'
+CACHE_DIR = Path(__file__).parent / 'data' / '.feature_cache'
+
+LAGS = 3
+LAGGED = ['PercentRenewable', 'PercentNonRenewable',
+          'Renewable_change', 'NonRenewable_change']
+
+
+def feature_columns(lags: int = LAGS) -> List[str]:
+    return [
+        'PercentRenewable', 'PercentNonRenewable', 'TotalEnergy',
+        'Renewable_change', 'NonRenewable_change'
+    ] + [f'{col}_lag{i}' for col in LAGGED for i in range(1, lags + 1)]
+
+
+FEATURE_COLS = feature_columns()
+
+
+def add_features(df: pd.DataFrame, lags: int = LAGS) -> pd.DataFrame:
+    """Sort by state/year and add the change and lag columns."""
+    df = df.sort_values(['State', 'Year']).reset_index(drop=True)
+
+    df['Renewable_change'] = df.groupby('State')['PercentRenewable'].diff()
+    df['NonRenewable_change'] = df.groupby(
+        'State')['PercentNonRenewable'].diff()
+
+    for lag in range(1, lags + 1):
+        for col in LAGGED:
+            df[f'{col}_lag{lag}'] = df.groupby('State')[col].shift(lag)
+    return df
+
+
+class EnergyFeatures:
+    """
+    Read-only, memory-mapped feature table. Rows are sorted by state and
+    year, so each state is a contiguous slice.
+    """
+
+    def __init__(self, states: np.ndarray, years: np.ndarray, values: np.ndarray,
+                 columns: List[str]):
+        self.states = states
+        self.years = years
+        self.values = values
+        self.columns = list(columns)
+        self.col_index = {c: i for i, c in enumerate(self.columns)}
+
+        bounds = np.flatnonzero(states[1:] != states[:-1]) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [len(states)]])
+        self.state_slices: Dict[str, slice] = {
+            str(states[s]): slice(int(s), int(e)) for s, e in zip(starts, ends)
+        } if len(states) else {}
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self.col_index[name]]
+
+    def frame(self, rows: slice = slice(None)) -> pd.DataFrame:
+        """DataFrame view over the mapped arrays (no copy of the values)."""
+        df = pd.DataFrame(self.values[rows], columns=self.columns, copy=False)
+        df.insert(0, 'Year', self.years[rows])
+        df.insert(0, 'State', self.states[rows])
+        return df
+
+    def state_frame(self, state: str) -> pd.DataFrame:
+        rows = self.state_slices.get(state)
+        if rows is None:
+            return self.frame(slice(0, 0))
+        return self.frame(rows)
+
+
+def _build(csv_path, out_dir: Path, lags: int):
+    df = add_features(pd.read_csv(csv_path), lags)
+    value_cols = [c for c in df.columns if c not in ('State', 'Year')]
+
+    tmp = out_dir.with_name(f'{out_dir.name}.tmp{os.getpid()}')
+    tmp.mkdir(parents=True, exist_ok=True)
+    np.save(tmp / 'states.npy', df['State'].to_numpy(dtype=str))
+    np.save(tmp / 'years.npy', df['Year'].to_numpy(dtype=np.int64))
+    np.save(tmp / 'values.npy', df[value_cols].to_numpy(dtype=np.float64))
+    (tmp / 'columns.json').write_text(json.dumps(value_cols))
+    try:
+        os.replace(tmp, out_dir)
+    except OSError:
+        # Another process published the same artifact first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+_loaded: Dict[tuple, tuple] = {}
+
+
+def load_features(csv_path=DATA_CSV, lags: int = LAGS) -> EnergyFeatures:
+    """
+    Feature table for ``csv_path``, building the on-disk artifact on first
+    use. Repeated calls return the same mapped object until the CSV changes.
+    """
+    csv_path = Path(csv_path).resolve()
+    st = os.stat(csv_path)
+    key = (str(csv_path), lags)
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    hit = _loaded.get(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+
+    out_dir = CACHE_DIR / f'{file_sha(csv_path)}-lags{lags}'
+    if not out_dir.exists():
+        _build(csv_path, out_dir, lags)
+
+    features = EnergyFeatures(
+        states=np.load(out_dir / 'states.npy'),
+        years=np.load(out_dir / 'years.npy', mmap_mode='r'),
+        values=np.load(out_dir / 'values.npy', mmap_mode='r'),
+        columns=json.loads((out_dir / 'columns.json').read_text()),
+    )
+    _loaded[key] = (stamp, features)
+    return features
@@ -1,58 +1,6 @@
-import pandas as pd
 import joblib
-
-
-def multi_year_forecast(initial_features_df, start_year, years_ahead, models, feature_cols, lags=3):
-    clf = models['clf']
-    reg_renew = models['reg_renew']
-    reg_nonrenew = models['reg_nonrenew']
-
-    current_year = start_year
-    history = initial_features_df.copy().reset_index(drop=True)
-
-    forecast_results = []
-
-    for _ in range(years_ahead):
-        pred_class = clf.predict(history)[0]
-        pred_renew = reg_renew.predict(history)[0]
-        pred_nonrenew = reg_nonrenew.predict(history)[0]
-
-        current_year += 1
-        forecast_results.append({
-            'Year': current_year,
-            'Pred_IncreaseRenewable': pred_class,
-            'Pred_PercentRenewable': pred_renew,
-            'Pred_PercentNonRenewable': pred_nonrenew
-        })
-
-        # Build next row for features
-        next_row = []
-        for col in feature_cols:
-            if col == 'PercentRenewable':
-                next_row.append(pred_renew)
-            elif col == 'PercentNonRenewable':
-                next_row.append(pred_nonrenew)
-            elif col == 'TotalEnergy':
-                next_row.append(history['TotalEnergy'].iloc[0])
-            elif col == 'Renewable_change':
-                next_row.append(
-                    pred_renew - history['PercentRenewable'].iloc[0])
-            elif col == 'NonRenewable_change':
-                next_row.append(
-                    pred_nonrenew - history['PercentNonRenewable'].iloc[0])
-            elif col.endswith('lag1'):
-                base_col = col.replace('_lag1', '')
-                next_row.append(history[base_col].iloc[0])
-            elif 'lag' in col:  # lag2 or lag3
-                lag_num = int(col[-1])
-                prev_lag = col.replace(f'lag{lag_num}', f'lag{lag_num-1}')
-                next_row.append(history[prev_lag].iloc[0])
-            else:
-                next_row.append(0)  # fallback
-
-        history = pd.DataFrame([next_row], columns=feature_cols)
-
-    return pd.DataFrame(forecast_results)
+from forecast_engine import multi_year_forecast
+from energy_features import FEATURE_COLS, LAGS, load_features
 
 
 # --- Load saved models ---
@@ -61,33 +9,10 @@ reg_renew = joblib.load('models/reg_renew.joblib')
 reg_nonrenew = joblib.load('models/reg_nonrenew.joblib')
 models = {'clf': clf, 'reg_renew': reg_renew, 'reg_nonrenew': reg_nonrenew}
 
-# --- Load dataset ---
-df = pd.read_csv('data/state_energy_summary.csv')
-df = df.sort_values(['State', 'Year'])
-
-# --- Compute changes and lags ---
-df['Renewable_change'] = df.groupby('State')['PercentRenewable'].diff()
-df['NonRenewable_change'] = df.groupby('State')['PercentNonRenewable'].diff()
-
-lags = 3
-for lag in range(1, lags+1):
-    df[f'PercentRenewable_lag{lag}'] = df.groupby(
-        'State')['PercentRenewable'].shift(lag)
-    df[f'PercentNonRenewable_lag{lag}'] = df.groupby(
-        'State')['PercentNonRenewable'].shift(lag)
-    df[f'Renewable_change_lag{lag}'] = df.groupby(
-        'State')['Renewable_change'].shift(lag)
-    df[f'NonRenewable_change_lag{lag}'] = df.groupby(
-        'State')['NonRenewable_change'].shift(lag)
-
-# --- Define feature columns ---
-feature_cols = [
-    'PercentRenewable', 'PercentNonRenewable', 'TotalEnergy',
-    'Renewable_change', 'NonRenewable_change'
-] + [f'PercentRenewable_lag{i}' for i in range(1, lags+1)] + \
-    [f'PercentNonRenewable_lag{i}' for i in range(1, lags+1)] + \
-    [f'Renewable_change_lag{i}' for i in range(1, lags+1)] + \
-    [f'NonRenewable_change_lag{i}' for i in range(1, lags+1)]
+# --- Load dataset with change and lag features ---
+df = load_features().frame()
+lags = LAGS
+feature_cols = FEATURE_COLS
 
 # --- User input ---
 state = input("Enter state abbreviation (e.g., CA): ").upper()
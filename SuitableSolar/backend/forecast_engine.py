@@ -0,0 +1,121 @@
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from forest_compiler import CompiledForest, as_compiled
+
+TARGETS = ['Pred_IncreaseRenewable',
+           'Pred_PercentRenewable', 'Pred_PercentNonRenewable']
+
+_LAG = re.compile(r'^(.*)_lag(\d+)$')
+
+
+class StepPlan:
+    """
+    How to build next year's feature row from this year's, precomputed once
+    per feature layout: ``next = X[:, source]`` shifts every lag/carry
+    column in one gather, then the predicted columns are written in place.
+    """
+
+    def __init__(self, feature_cols: Sequence[str]):
+        cols = list(feature_cols)
+        index = {c: i for i, c in enumerate(cols)}
+
+        self.source = np.arange(len(cols))
+        self.zero = np.zeros(len(cols), dtype=bool)
+        for i, col in enumerate(cols):
+            m = _LAG.match(col)
+            if m:
+                base, lag = m.group(1), int(m.group(2))
+                prev = base if lag == 1 else f'{base}_lag{lag - 1}'
+                self.source[i] = index[prev]
+            elif col not in ('PercentRenewable', 'PercentNonRenewable', 'TotalEnergy',
+                             'Renewable_change', 'NonRenewable_change'):
+                self.zero[i] = True
+
+        self.renew = index['PercentRenewable']
+        self.nonrenew = index['PercentNonRenewable']
+        self.renew_change = index.get('Renewable_change')
+        self.nonrenew_change = index.get('NonRenewable_change')
+
+    def advance(self, X: np.ndarray, pred_renew: np.ndarray, pred_nonrenew: np.ndarray) -> np.ndarray:
+        nxt = X[:, self.source]
+        nxt[:, self.zero] = 0
+        if self.renew_change is not None:
+            nxt[:, self.renew_change] = pred_renew - X[:, self.renew]
+        if self.nonrenew_change is not None:
+            nxt[:, self.nonrenew_change] = pred_nonrenew - X[:, self.nonrenew]
+        nxt[:, self.renew] = pred_renew
+        nxt[:, self.nonrenew] = pred_nonrenew
+        return nxt
+
+
+def forecast_batch(X, years_ahead: int, models, feature_cols: Sequence[str],
+                   backend: str = 'sklearn') -> Dict[str, np.ndarray]:
+    """
+    Recursive forecast for many rows at once.
+
+    ``X`` is an (n_rows x n_features) matrix of starting feature rows. All
+    rows are advanced together, so each model is called once per year
+    regardless of n_rows. Returns an (n_rows x years_ahead) array per target.
+
+    ``backend='compiled'`` scores with flattened NumPy forests (see
+    forest_compiler) instead of sklearn; predictions are identical.
+    Models that are already ``CompiledForest`` always use it.
+    """
+    feature_cols = list(feature_cols)
+    plan = StepPlan(feature_cols)
+    X = np.array(X, dtype=np.float64)
+    n = len(X)
+
+    if backend == 'compiled':
+        models = {name: as_compiled(m) for name, m in models.items()}
+    elif backend != 'sklearn':
+        raise ValueError(f"Unknown forecast backend: {backend}")
+    arrays_ok = all(isinstance(m, CompiledForest) for m in models.values())
+
+    out = {t: np.empty((n, years_ahead)) for t in TARGETS}
+    for step in range(years_ahead):
+        # The sklearn forests were fitted on DataFrames; keep the feature names
+        frame = X if arrays_ok else pd.DataFrame(
+            X, columns=feature_cols, copy=False)
+        out['Pred_IncreaseRenewable'][:, step] = models['clf'].predict(frame)
+        pred_renew = models['reg_renew'].predict(frame)
+        pred_nonrenew = models['reg_nonrenew'].predict(frame)
+        out['Pred_PercentRenewable'][:, step] = pred_renew
+        out['Pred_PercentNonRenewable'][:, step] = pred_nonrenew
+
+        X = plan.advance(X, pred_renew, pred_nonrenew)
+
+    return out
+
+
+def multi_year_forecast(initial_features_df, start_year, years_ahead, models, feature_cols, lags=3,
+                        backend='sklearn'):
+    """Single-row forecast as a DataFrame with one row per forecast year."""
+    X = initial_features_df[list(feature_cols)].to_numpy(dtype=np.float64)[:1]
+    preds = forecast_batch(X, years_ahead, models, feature_cols, backend)
+
+    result = pd.DataFrame({'Year': np.arange(start_year + 1, start_year + years_ahead + 1)})
+    for t in TARGETS:
+        result[t] = preds[t][0]
+    return result
+
+
+def latest_feature_rows(df: pd.DataFrame, feature_cols: Sequence[str]) -> Tuple[List[str], np.ndarray, np.ndarray, List[str]]:
+    """
+    Latest year's feature row for every state.
+
+    Returns (states, start_years, X, skipped) where ``skipped`` lists states
+    whose latest row has missing features.
+    """
+    latest = df.sort_values(['State', 'Year']).groupby('State').tail(1)
+    complete = latest[list(feature_cols)].notna().all(axis=1)
+
+    usable = latest[complete]
+    return (usable['State'].tolist(),
+            usable['Year'].to_numpy(dtype=int),
+            usable[list(feature_cols)].to_numpy(dtype=np.float64),
+            latest.loc[~complete, 'State'].tolist())
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from db import read_only_uri
+from forecast_engine import TARGETS
+
+DDL = """
+DROP TABLE IF EXISTS state_forecasts;
+DROP TABLE IF EXISTS forecast_meta;
+
+CREATE TABLE state_forecasts (
+  State                     TEXT NOT NULL,
+  Year                      INTEGER NOT NULL,
+  Pred_PercentRenewable     REAL,
+  Pred_PercentNonRenewable  REAL,
+  Pred_IncreaseRenewable    REAL,
+  PRIMARY KEY (State, Year)
+);
+
+CREATE TABLE forecast_meta (
+  key    TEXT PRIMARY KEY,
+  value  TEXT
+);
+"""
+
+
+def write_forecast_table(path, states: Sequence[str], start_years: Sequence[int],
+                         preds: Dict[str, np.ndarray], model_fingerprint: str,
+                         data_fingerprint: str):
+    """
+    Store the output of ``forecast_engine.forecast_batch`` (one row per
+    state and forecast year) together with the fingerprints of the models
+    and data it was computed from.
+    """
+    horizon = preds['Pred_PercentRenewable'].shape[1]
+    rows = []
+    for i, state in enumerate(states):
+        for step in range(horizon):
+            rows.append((
+                state,
+                int(start_years[i]) + step + 1,
+                float(preds['Pred_PercentRenewable'][i, step]),
+                float(preds['Pred_PercentNonRenewable'][i, step]),
+                float(preds['Pred_IncreaseRenewable'][i, step]),
+            ))
+
+    # Built aside and swapped in, so readers see the old table or the new one
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with closing(sqlite3.connect(tmp)) as con, con:
+        con.executescript(DDL)
+        con.executemany(
+            "INSERT INTO state_forecasts VALUES (?, ?, ?, ?, ?)", rows)
+        con.executemany("INSERT INTO forecast_meta VALUES (?, ?)", [
+            ("model_fingerprint", model_fingerprint),
+            ("data_fingerprint", data_fingerprint),
+            ("horizon", str(horizon)),
+        ])
+    os.replace(tmp, path)
+
+
+def load_forecast_table(path, model_fingerprint: str, data_fingerprint: str) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Read the materialized forecasts as {state: DataFrame} in the same layout
+    as ``multi_year_forecast``. Returns None if the table is missing or was
+    built from different models or data.
+    """
+    try:
+        with closing(sqlite3.connect(read_only_uri(path), uri=True)) as con:
+            meta = dict(con.execute("SELECT key, value FROM forecast_meta"))
+            if (meta.get("model_fingerprint") != model_fingerprint
+                    or meta.get("data_fingerprint") != data_fingerprint):
+                print(f"⚠️ Forecast table {path} was built from other models or data; "
+                      f"forecasts will be computed live until predictionModel.py is rerun")
+                return None
+            table = pd.read_sql_query(
+                "SELECT * FROM state_forecasts ORDER BY State, Year", con)
+    except sqlite3.Error as e:
+        print(f"⚠️ No usable forecast table at {path} ({e}); forecasts will be computed live")
+        return None
+
+    return {
+        state: group[['Year'] + TARGETS].reset_index(drop=True)
+        for state, group in table.groupby('State')
+    }
@@ -0,0 +1,218 @@
+"""
+Export fitted random forests to flat NumPy node arrays and score them
+without sklearn or pandas.
+
+Every tree's nodes are concatenated into one set of arrays (feature,
+threshold, left, right, value). Leaves point to themselves, so all trees
+can be walked together for a fixed number of steps (the deepest tree's
+depth) with a handful of vectorized gathers.
+
+    python forest_compiler.py [models_dir]
+
+compiles every models/*.joblib into a scratch directory and checks the
+compiled forest, as loaded back from its .npz, against sklearn's predict.
+The .npz files next to the models are left alone.
+"""
+import os
+import sys
+import tempfile
+import time
+import weakref
+from typing import Dict, Optional
+
+import numpy as np
+
+from ttl_cache import file_fingerprint
+
+MODEL_NAMES = ('clf', 'reg_renew', 'reg_nonrenew')
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, value, roots, depth,
+                 classes=None, source=''):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        # (n_nodes x n_values): class probabilities or the regression output
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.classes = classes
+        # Fingerprint of the joblib file this was compiled from
+        self.source = source
+
+    @property
+    def is_classifier(self) -> bool:
+        return self.classes is not None
+
+    def _leaf_values(self, X) -> np.ndarray:
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        rows = np.arange(len(X))[None, :]
+
+        nodes = np.repeat(self.roots[:, None], len(X), axis=1)
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes]
+
+    def _mean(self, X) -> np.ndarray:
+        # cumsum adds tree by tree like sklearn does; sum() would use
+        # pairwise summation and drift in the last bits
+        return np.cumsum(self._leaf_values(X), axis=0)[-1] / len(self.roots)
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self._mean(X)
+
+    def predict(self, X) -> np.ndarray:
+        mean = self._mean(X)
+        if self.is_classifier:
+            return self.classes[np.argmax(mean, axis=1)]
+        return mean[:, 0]
+
+    def save(self, path):
+        extra = {} if self.classes is None else {'classes': self.classes}
+        np.savez(path, feature=self.feature, threshold=self.threshold,
+                 left=self.left, right=self.right, value=self.value,
+                 roots=self.roots, depth=self.depth, source=self.source, **extra)
+
+    @classmethod
+    def load(cls, path) -> 'CompiledForest':
+        with np.load(path) as z:
+            return cls(z['feature'], z['threshold'], z['left'], z['right'],
+                       z['value'], z['roots'], z['depth'],
+                       classes=z['classes'] if 'classes' in z else None,
+                       source=str(z['source']))
+
+
+def compile_forest(model, source: str = '') -> CompiledForest:
+    """Flatten a fitted RandomForestClassifier/Regressor (single output)."""
+    is_classifier = hasattr(model, 'classes_')
+
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    for est in model.estimators_:
+        tree = est.tree_
+        n = tree.node_count
+        ids = np.arange(offset, offset + n)
+        leaf = tree.children_left == -1
+
+        feature.append(np.where(leaf, 0, tree.feature))
+        threshold.append(np.where(leaf, 0.0, tree.threshold))
+        left.append(np.where(leaf, ids, tree.children_left + offset))
+        right.append(np.where(leaf, ids, tree.children_right + offset))
+
+        v = tree.value[:, 0, :].astype(np.float64)
+        if is_classifier:
+            # Older sklearn stores weighted counts; predict_proba normalizes
+            v = v / v.sum(axis=1, keepdims=True)
+        value.append(v)
+
+        roots.append(offset)
+        offset += n
+
+    return CompiledForest(
+        feature=np.concatenate(feature).astype(np.intp),
+        threshold=np.concatenate(threshold),
+        left=np.concatenate(left).astype(np.intp),
+        right=np.concatenate(right).astype(np.intp),
+        value=np.concatenate(value),
+        roots=np.array(roots, dtype=np.intp),
+        depth=max(est.tree_.max_depth for est in model.estimators_),
+        classes=np.asarray(model.classes_) if is_classifier else None,
+        source=source,
+    )
+
+
+_compiled = weakref.WeakKeyDictionary()
+
+
+def as_compiled(model) -> CompiledForest:
+    """Compiled version of a fitted forest, compiled once per model object."""
+    if isinstance(model, CompiledForest):
+        return model
+    compiled = _compiled.get(model)
+    if compiled is None:
+        compiled = _compiled[model] = compile_forest(model)
+    return compiled
+
+
+def compile_model_dir(models_dir='models', names=MODEL_NAMES,
+                      out_dir: Optional[str] = None) -> Dict[str, CompiledForest]:
+    """
+    Compile every joblib forest in ``models_dir`` and save the .npz files
+    next to them, or into ``out_dir`` if given.
+    """
+    import joblib
+
+    out_dir = models_dir if out_dir is None else out_dir
+    compiled = {}
+    for name in names:
+        src = os.path.join(models_dir, f'{name}.joblib')
+        compiled[name] = compile_forest(joblib.load(src), source=file_fingerprint(src))
+        compiled[name].save(os.path.join(out_dir, f'{name}.npz'))
+    return compiled
+
+
+def load_compiled_models(models_dir='models', names=MODEL_NAMES) -> Optional[Dict[str, CompiledForest]]:
+    """
+    Load the .npz forests if all exist and were compiled from the current
+    joblib files, else None.
+    """
+    models = {}
+    for name in names:
+        npz = os.path.join(models_dir, f'{name}.npz')
+        src = os.path.join(models_dir, f'{name}.joblib')
+        if not os.path.exists(npz):
+            return None
+        forest = CompiledForest.load(npz)
+        if os.path.exists(src) and forest.source != file_fingerprint(src):
+            return None
+        models[name] = forest
+    return models
+
+
+def check_parity(model, compiled: CompiledForest, X) -> float:
+    """Largest absolute difference between sklearn's and the compiled predict."""
+    expected = model.predict(X)
+    actual = compiled.predict(np.asarray(X))
+    return float(np.max(np.abs(expected.astype(float) - actual.astype(float))))
+
+
+if __name__ == '__main__':
+    import joblib
+    import pandas as pd
+
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else 'models'
+    # Compile into a scratch directory and check what loads back from it;
+    # the .npz files the server uses are only written by predictionModel.py
+    with tempfile.TemporaryDirectory() as scratch:
+        compile_model_dir(models_dir, out_dir=scratch)
+        compiled = {name: CompiledForest.load(os.path.join(scratch, f'{name}.npz'))
+                    for name in MODEL_NAMES}
+
+    # Parity and 1-row latency on random feature rows
+    rng = np.random.default_rng(0)
+    for name, forest in compiled.items():
+        model = joblib.load(os.path.join(models_dir, f'{name}.joblib'))
+        cols = list(getattr(model, 'feature_names_in_', range(model.n_features_in_)))
+        X = pd.DataFrame(rng.normal(0, 50, size=(2000, len(cols))), columns=cols)
+        diff = check_parity(model, forest, X)
+
+        row_df, row = X.iloc[:1], X.to_numpy()[:1]
+        t = time.perf_counter()
+        for _ in range(20):
+            model.predict(row_df)
+        sk = (time.perf_counter() - t) / 20
+        t = time.perf_counter()
+        for _ in range(200):
+            forest.predict(row)
+        fast = (time.perf_counter() - t) / 200
+
+        print(f"{name}: max |diff| = {diff:.3g}, 1-row predict "
+              f"{sk * 1e3:.2f} ms -> {fast * 1e3:.3f} ms ({sk / fast:.0f}x)")
+        if diff > 1e-9:
+            sys.exit(f"{name}: compiled forest does not match sklearn")
@@ -0,0 +1,93 @@
+import threading
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from db import db_signature, read_pool
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km_array(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Great-circle distance (km) from one point to arrays of points."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    # Rounding can push a a hair past 1 for antipodal points
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def smallest(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest values, smallest first (ties by index)."""
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    idx = np.argpartition(values, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    return idx[np.lexsort((idx, values[idx]))]
+
+
+class HaversineIndex:
+    """
+    Great-circle nearest-neighbour search over a fixed set of points,
+    answering many query points in one vectorized BallTree query.
+    """
+
+    def __init__(self, lats, lons):
+        points = np.radians(np.stack([np.asarray(lats, dtype=np.float64),
+                                      np.asarray(lons, dtype=np.float64)], axis=1))
+        self.size = len(points)
+        self.tree = BallTree(points, metric='haversine') if self.size else None
+
+    def nearest(self, lats, lons, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(n x k) point indices and distances (km), closest first."""
+        query = np.radians(np.stack([np.asarray(lats, dtype=np.float64),
+                                     np.asarray(lons, dtype=np.float64)], axis=1))
+        if self.tree is None or len(query) == 0:
+            return (np.full((len(query), k), -1, dtype=np.int64),
+                    np.full((len(query), k), np.inf))
+        k = min(k, self.size)
+        dist, idx = self.tree.query(query, k=k)
+        return idx, dist * EARTH_RADIUS_KM
+
+
+class GeoIndex:
+    """
+    Exact great-circle nearest-neighbour search over every location (or
+    every row of ``query``, which selects id, latitude, longitude).
+
+    Keeps a haversine BallTree of all points in memory and rebuilds it when
+    the database file changes. A query returns the true k nearest, sorted,
+    at any distance; its cost depends on k, not on how dense the area is.
+    """
+
+    def __init__(self, db_path: Path, query: str = "SELECT id, Latitude, Longitude FROM locations"):
+        self.db_path = Path(db_path)
+        self.query = query
+        self.ids = np.empty(0, dtype=np.int64)
+        self.index = HaversineIndex([], [])
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def ensure_current(self):
+        signature = db_signature(self.db_path)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            with read_pool(self.db_path).connection() as con:
+                rows = con.execute(self.query).fetchall()
+            points = np.array([r[1:] for r in rows], dtype=np.float64).reshape(-1, 2)
+            self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+            self.index = HaversineIndex(points[:, 0], points[:, 1])
+            self._signature = signature
+
+    def nearest(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and distances (km) of the k nearest rows, closest first."""
+        self.ensure_current()
+        if self.index.size == 0:
+            return self.ids[:0], np.empty(0)
+        idx, dist = self.index.nearest([lat], [lon], k)
+        return self.ids[idx[0]], dist[0]
@@ -1,62 +1,172 @@
+import argparse
+import math
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-import osmnx as ox
-from shapely.geometry import Point
-from geopy.distance import geodesic
-from tqdm import tqdm
+
+from CONSTANTS import DATABASE
+from geo_index import HaversineIndex
 
 # Paths and config
 INPUT_FILE = "backend/data/solar_results.csv"
 OUTPUT_FILE = "backend/data/solar_with_nearest_substation.csv"
+DB_PATH = Path(__file__).with_name(DATABASE)
 SEARCH_RADIUS_METERS = 50000
 
-df = pd.read_csv(INPUT_FILE)
-tqdm.pandas()
-
-
-def get_substations(lat, lon, dist=SEARCH_RADIUS_METERS):
-    tags = {
-        'power': ['substation', 'station', 'plant', 'transformer', 'switch']
-    }
-    try:
-        gdf = ox.features_from_point((lat, lon), tags, dist=dist)
-        if gdf.empty:
-            return None
-
-        utm_crs = ox.projection.project_gdf(gdf).crs
-        gdf_proj = gdf.to_crs(utm_crs)
-
-        # Calculate centroids on projected CRS
-        centroids = gdf_proj.geometry.centroid
-
-        # Convert centroids back to geographic CRS (lat/lon) for distance calculation
-        centroids_latlon = centroids.to_crs(gdf.crs)
-
-        point = Point(lon, lat)
-        # Calculate geodesic distance from input point to each centroid
-        gdf['dist_km'] = centroids_latlon.apply(
-            lambda geom: geodesic((lat, lon), (geom.y, geom.x)).km)
-
-        return gdf
-
-    except Exception as e:
-        print(
-            f"⚠️ Failed to fetch OSM power features near ({lat}, {lon}): {e}")
-        return None
-
-
-def find_nearest_substation(lat, lon):
-    gdf = get_substations(lat, lon)
-    if gdf is None or gdf.empty:
-        return None
-
-    return gdf['dist_km'].min()
-
-
-df['nearest_substation_km'] = df.progress_apply(
-    lambda row: find_nearest_substation(row['Latitude'], row['Longitude']),
-    axis=1
-)
-
-
-df.to_csv(OUTPUT_FILE, index=False)
-print(f"\n✅ Done! Output saved to {OUTPUT_FILE}")
+POWER_TAGS = {
+    'power': ['substation', 'station', 'plant', 'transformer', 'switch']
+}
+
+# Parcels are grouped into cells this many degrees wide; each cell's
+# features are downloaded once, however many parcels it holds
+CELL_DEG = 2.0
+
+
+def _region_boxes(lats, lons, margin_m=SEARCH_RADIUS_METERS, cell_deg=CELL_DEG):
+    """
+    (west, south, east, north) boxes covering every parcel plus margin.
+    Parcels without coordinates (NaN) are left out.
+    """
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    located = np.isfinite(lats) & np.isfinite(lons)
+    lats, lons = lats[located], lons[located]
+    cells = np.unique(np.stack([np.floor(lats / cell_deg), np.floor(lons / cell_deg)], axis=1), axis=0)
+
+    boxes = []
+    for cy, cx in cells:
+        in_cell = (np.floor(lats / cell_deg) == cy) & (np.floor(lons / cell_deg) == cx)
+        south, north = lats[in_cell].min(), lats[in_cell].max()
+        west, east = lons[in_cell].min(), lons[in_cell].max()
+        dlat = margin_m / 111320
+        dlon = margin_m / (111320 * max(0.01, math.cos(math.radians(max(abs(south), abs(north))))))
+        boxes.append((west - dlon, max(-90, south - dlat), east + dlon, min(90, north + dlat)))
+    return boxes
+
+
+def read_substations(lats, lons, db_path=DB_PATH, margin_m=SEARCH_RADIUS_METERS) -> pd.DataFrame:
+    """
+    Power features around all parcels from the substations table (see
+    osm_ingest.py), found through its R*-tree a region box at a time.
+    Same columns as load_substations.
+    """
+    frames = []
+    with closing(sqlite3.connect(db_path)) as con:
+        for west, south, east, north in _region_boxes(lats, lons, margin_m):
+            frames.append(pd.read_sql_query("""
+                SELECT s.osm_id AS id, s.type, s.lat, s.lon
+                FROM substations_rtree AS r JOIN substations AS s ON s.id = r.id
+                WHERE r.min_lat <= :north AND r.max_lat >= :south
+                  AND r.min_lon <= :east AND r.max_lon >= :west
+            """, con, params={"north": north, "south": south, "east": east, "west": west}))
+    if not frames:
+        return pd.DataFrame(columns=['id', 'type', 'lat', 'lon'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates('id', ignore_index=True)
+
+
+def _features_from_bbox(ox, bbox, tags):
+    # osmnx 2 takes one (west, south, east, north) tuple; 1.x took
+    # north, south, east, west as separate arguments
+    if int(ox.__version__.split('.')[0]) >= 2:
+        return ox.features_from_bbox(bbox, tags)
+    west, south, east, north = bbox
+    return ox.features_from_bbox(north, south, east, west, tags=tags)
+
+
+def load_substations(lats, lons, margin_m=SEARCH_RADIUS_METERS) -> pd.DataFrame:
+    """
+    Download OSM power features around all parcels, a cell at a time, and
+    return one row per distinct feature: id ("node/123"), type (the power
+    tag), and the centroid's lat/lon.
+    """
+    import osmnx as ox
+
+    frames = []
+    boxes = _region_boxes(lats, lons, margin_m)
+    for i, bbox in enumerate(boxes, start=1):
+        try:
+            gdf = _features_from_bbox(ox, bbox, POWER_TAGS)
+        except Exception as e:
+            # osmnx raises when a box has no matching features
+            print(f"⚠️ No OSM power features for box {i}/{len(boxes)} {bbox}: {e}")
+            continue
+
+        # Calculate centroids on projected CRS, then back to lat/lon
+        centroids = gdf.geometry.to_crs(gdf.estimate_utm_crs()).centroid.to_crs(gdf.crs)
+        frames.append(pd.DataFrame({
+            'id': [f"{element}/{osmid}" for element, osmid in gdf.index],
+            'type': gdf['power'].to_numpy(),
+            'lat': centroids.y.to_numpy(),
+            'lon': centroids.x.to_numpy(),
+        }))
+        print(f"Loaded {len(gdf)} power features for box {i}/{len(boxes)}")
+
+    if not frames:
+        return pd.DataFrame(columns=['id', 'type', 'lat', 'lon'])
+    # Neighbouring boxes overlap; keep each feature once
+    return pd.concat(frames, ignore_index=True).drop_duplicates('id', ignore_index=True)
+
+
+def nearest_substations(substations: pd.DataFrame, lats, lons,
+                        max_km=SEARCH_RADIUS_METERS / 1000) -> pd.DataFrame:
+    """
+    Great-circle distance (km), id and type of the nearest power feature
+    for every parcel, in one BallTree query. Parcels with nothing within
+    ``max_km``, or without coordinates, get NaN/None.
+    """
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    located = np.isfinite(lats) & np.isfinite(lons)
+    idx = np.full(len(lats), -1, dtype=np.int64)
+    km = np.full(len(lats), np.inf)
+
+    index = HaversineIndex(substations['lat'], substations['lon'])
+    found_idx, found_km = index.nearest(lats[located], lons[located], k=1)
+    idx[located], km[located] = found_idx[:, 0], found_km[:, 0]
+    found = km <= max_km
+    # Misses point at a trailing None
+    idx = np.where(found, idx, len(substations))
+
+    ids = np.append(substations['id'].to_numpy(dtype=object), None)
+    types = np.append(substations['type'].to_numpy(dtype=object), None)
+    return pd.DataFrame({
+        'nearest_substation_km': np.where(found, km, np.nan),
+        'nearest_substation_id': ids[idx],
+        'nearest_substation_type': types[idx],
+    })
+
+
+def add_grid_distance(df: pd.DataFrame, substations: pd.DataFrame = None) -> pd.DataFrame:
+    if substations is None:
+        substations = read_substations(df['Latitude'], df['Longitude'])
+    nearest = nearest_substations(substations, df['Latitude'], df['Longitude'])
+    for col in nearest.columns:
+        df[col] = nearest[col].to_numpy()
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add nearest-substation distance to solar results")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--db", default=str(DB_PATH),
+                        help="database with the substations table (load it with osm_ingest.py)")
+    parser.add_argument("--overpass", action="store_true",
+                        help="download features from OSM with osmnx instead of reading --db")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input)
+    if args.overpass:
+        substations = load_substations(df['Latitude'], df['Longitude'])
+    else:
+        substations = read_substations(df['Latitude'], df['Longitude'], args.db)
+    if substations.empty:
+        print("⚠️ No power features found around the parcels")
+    df = add_grid_distance(df, substations)
+    df.to_csv(args.output, index=False)
+    print(f"\n✅ Done! Output saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
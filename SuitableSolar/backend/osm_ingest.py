@@ -0,0 +1,358 @@
+"""
+Offline load of OSM power infrastructure into the ``substations`` table.
+
+Reads a local extract and keeps every feature tagged
+power=substation/station/plant/transformer/switch, at its centroid:
+
+- ``.osm.pbf`` / ``.osm``: streamed with pyosmium (optional dependency).
+  Closed ways and multipolygon relations are assembled into areas.
+- ``.geojsonseq`` / ``.geojsonl``: one feature per line.
+- ``.geojson`` / ``.json``: a FeatureCollection, decoded one feature at a
+  time so the whole file is never held in memory.
+
+GeoJSON as written by ``osmium export``, osmtogeojson/Overpass and
+``ogr2ogr`` is understood. Rows are upserted by OSM id in batched
+transactions, so rerunning with a newer extract updates in place; pass
+``--replace`` to drop features missing from the new extract.
+
+    python osm_ingest.py EXTRACT [--db PATH] [--replace] [--batch-size N]
+
+Run schema.py first.
+"""
+import argparse
+import json
+import math
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from CONSTANTS import DATABASE
+
+DB_PATH = Path(__file__).with_name(DATABASE)
+BATCH_SIZE = 5000
+READ_SIZE = 1 << 20
+
+POWER_TYPES = ('substation', 'station', 'plant', 'transformer', 'switch')
+COLUMNS = ('osm_id', 'type', 'name', 'voltage', 'operator', 'lat', 'lon')
+
+OSM_TYPES = {'n': 'node', 'w': 'way', 'r': 'relation'}
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+# --- Geometry ---
+
+def ring_centroid(lons, lats):
+    """
+    Area-weighted centroid of a ring, as (lon, lat, area). Planar on an
+    equirectangular projection, which is plenty at substation scale.
+    Degenerate rings fall back to the vertex mean with area 0.
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    k = math.cos(math.radians(float(lats.mean())))
+    # Relative to the first vertex, so the cross products don't cancel
+    x, y = (lons - lons[0]) * k, lats - lats[0]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y1 - x1 * y
+    area = cross.sum() / 2
+    if abs(area) < 1e-14:
+        return float(lons.mean()), float(lats.mean()), 0.0
+    cx = ((x + x1) * cross).sum() / (6 * area)
+    cy = ((y + y1) * cross).sum() / (6 * area)
+    return float(lons[0] + cx / k), float(lats[0] + cy), abs(float(area))
+
+
+def rings_centroid(rings):
+    """Centroid (lon, lat) of several outer rings, weighted by area."""
+    parts = [ring_centroid(lons, lats) for lons, lats in rings if len(lons)]
+    if not parts:
+        return None
+    total = sum(a for _, _, a in parts)
+    if total == 0:
+        return (sum(x for x, _, _ in parts) / len(parts),
+                sum(y for _, y, _ in parts) / len(parts))
+    return (sum(x * a for x, _, a in parts) / total,
+            sum(y * a for _, y, a in parts) / total)
+
+
+def geometry_centroid(geometry) -> Optional[tuple]:
+    """(lon, lat) of a GeoJSON geometry, or None if it has no coordinates."""
+    if not geometry:
+        return None
+    kind, coords = geometry.get('type'), geometry.get('coordinates')
+    if kind == 'GeometryCollection':
+        points = [c for c in map(geometry_centroid, geometry.get('geometries', [])) if c]
+        return tuple(np.mean(points, axis=0)) if points else None
+    if not coords:
+        return None
+    if kind == 'Point':
+        return float(coords[0]), float(coords[1])
+    if kind == 'Polygon':
+        coords = [coords]
+    if kind in ('Polygon', 'MultiPolygon'):
+        # Outer rings only; holes barely move a substation's centroid
+        rings = [np.asarray(poly[0], dtype=np.float64) for poly in coords if poly]
+        return rings_centroid([(r[:, 0], r[:, 1]) for r in rings])
+    # (Multi)Point / (Multi)LineString: mean of the vertices
+    flat = np.array(list(_positions(coords)), dtype=np.float64)
+    return (float(flat[:, 0].mean()), float(flat[:, 1].mean())) if len(flat) else None
+
+
+def _positions(coords):
+    if coords and isinstance(coords[0], (int, float)):
+        yield coords[:2]
+    else:
+        for c in coords:
+            yield from _positions(c)
+
+
+# --- GeoJSON ---
+
+def _osm_id(feature, props) -> Optional[str]:
+    """'node/123' style id from the conventions of the common exporters."""
+    raw = feature.get('id') or props.get('@id') or props.get('id')
+    if raw is None and props.get('osm_way_id'):
+        raw = f"way/{props['osm_way_id']}"       # ogr2ogr multipolygons from closed ways
+    if raw is None and props.get('osm_id'):
+        # ogr2ogr: which element osm_id names depends on the layer, which
+        # the geometry gives away (points: nodes, lines: ways;
+        # multilinestrings, multipolygons, other_relations: relations)
+        kind = (feature.get('geometry') or {}).get('type')
+        element = {'Point': 'node', 'LineString': 'way'}.get(kind, 'relation')
+        raw = f"{element}/{props['osm_id']}"
+    if raw is None:
+        return None
+    raw = str(raw)
+    if '/' in raw:
+        return raw
+    # osmium export --add-unique-id=type_id: n123 / w123 / r123
+    if raw[:1] in OSM_TYPES and raw[1:].lstrip('-').isdigit():
+        return f"{OSM_TYPES[raw[0]]}/{raw[1:]}"
+    return raw
+
+
+def _tags(props) -> dict:
+    if isinstance(props.get('tags'), dict):
+        return props['tags']
+    if 'power' not in props and isinstance(props.get('other_tags'), str):
+        # ogr2ogr packs unlisted tags as '"k"=>"v","k2"=>"v2"'
+        tags = dict(props)
+        for pair in props['other_tags'].split('","'):
+            k, sep, v = pair.strip('"').partition('"=>"')
+            if sep:
+                tags[k] = v
+        return tags
+    return props
+
+
+def feature_row(feature) -> Optional[tuple]:
+    """Table row for a GeoJSON feature, or None if it isn't a power feature."""
+    props = feature.get('properties') or {}
+    tags = _tags(props)
+    power = tags.get('power')
+    if power not in POWER_TYPES:
+        return None
+    centroid = geometry_centroid(feature.get('geometry'))
+    if centroid is None:
+        return None
+    lon, lat = centroid
+    osm_id = _osm_id(feature, props) or f"{power}@{lat:.7f},{lon:.7f}"
+    return (osm_id, power, tags.get('name'), tags.get('voltage'),
+            tags.get('operator'), lat, lon)
+
+
+def _geojsonseq_features(f) -> Iterator[dict]:
+    for line in f:
+        # RFC 8142 prefixes each record with an ASCII record separator
+        line = line.strip().lstrip('\x1e')
+        if line:
+            yield json.loads(line)
+
+
+def _feature_collection_features(f, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """Decode the "features" array one element at a time."""
+    decoder = json.JSONDecoder()
+    buf, pos = '', 0
+    eof = False
+
+    def fill():
+        # Drop what's been decoded and append the next chunk
+        nonlocal buf, pos, eof
+        chunk = f.read(read_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+    # Find the start of the array
+    while True:
+        start = buf.find('"features"')
+        if start >= 0:
+            bracket = buf.find('[', start)
+            if bracket >= 0:
+                pos = bracket + 1
+                break
+        if eof:
+            return
+        fill()
+
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if buf.startswith(']', pos):
+            return
+        try:
+            feature, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        yield feature
+
+
+def geojson_rows(path: Path) -> Iterator[tuple]:
+    with open(path, encoding='utf-8') as f:
+        seq = path.suffix.lower() in ('.geojsonseq', '.geojsonl', '.geojsonld', '.jsonl', '.ndjson')
+        features = _geojsonseq_features(f) if seq else _feature_collection_features(f)
+        for feature in features:
+            row = feature_row(feature)
+            if row is not None:
+                yield row
+
+
+# --- OSM PBF / XML ---
+
+def osm_rows(path: Path, flush, batch_size: int = BATCH_SIZE, index: str = 'flex_mem'):
+    """
+    Stream power features from an OSM file through pyosmium, passing
+    batches of rows to ``flush``. ``index`` is the node-location store;
+    use e.g. 'dense_file_array,nodes.cache' to keep it on disk.
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise SystemExit("Reading .osm.pbf needs pyosmium (pip install osmium); "
+                         "or export the extract to GeoJSON first")
+
+    class Handler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.batch: List[tuple] = []
+
+        def _add(self, osm_id, tags, lon, lat):
+            self.batch.append((osm_id, tags.get('power'), tags.get('name'),
+                               tags.get('voltage'), tags.get('operator'), lat, lon))
+            if len(self.batch) >= batch_size:
+                flush(self.batch)
+                self.batch = []
+
+        def node(self, n):
+            if n.tags.get('power') in POWER_TYPES and n.location.valid():
+                self._add(f"node/{n.id}", n.tags, n.location.lon, n.location.lat)
+
+        def way(self, w):
+            # Closed ways arrive again as areas
+            if w.tags.get('power') not in POWER_TYPES or w.is_closed():
+                return
+            locs = [(nd.lon, nd.lat) for nd in w.nodes if nd.location.valid()]
+            if locs:
+                lon, lat = np.mean(locs, axis=0)
+                self._add(f"way/{w.id}", w.tags, float(lon), float(lat))
+
+        def area(self, a):
+            if a.tags.get('power') not in POWER_TYPES:
+                return
+            rings = []
+            for ring in a.outer_rings():
+                locs = [(nd.lon, nd.lat) for nd in ring if nd.location.valid()]
+                if locs:
+                    rings.append(tuple(np.asarray(locs, dtype=np.float64).T))
+            centroid = rings_centroid(rings)
+            if centroid is not None:
+                kind = 'way' if a.from_way() else 'relation'
+                self._add(f"{kind}/{a.orig_id()}", a.tags, *centroid)
+
+    handler = Handler()
+    handler.apply_file(str(path), locations=True, idx=index)
+    if handler.batch:
+        flush(handler.batch)
+
+
+# --- SQLite ---
+
+UPSERT = f"""
+    INSERT INTO substations ({', '.join(COLUMNS)})
+    VALUES ({', '.join('?' * len(COLUMNS))})
+    ON CONFLICT (osm_id) DO UPDATE SET
+      type = excluded.type, name = excluded.name, voltage = excluded.voltage,
+      operator = excluded.operator, lat = excluded.lat, lon = excluded.lon
+"""
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest(path, db_path=DB_PATH, replace: bool = False, batch_size: int = BATCH_SIZE,
+           index: str = 'flex_mem') -> int:
+    """Load the power features of an extract. Returns the number of rows read."""
+    path = Path(path)
+    with closing(sqlite3.connect(db_path)) as con, con:
+        if not con.execute("SELECT 1 FROM sqlite_master WHERE name = 'substations'").fetchone():
+            raise SystemExit(f"No substations table in {db_path}; run schema.py first")
+
+        if replace:
+            # Features seen in this run are marked; the rest are dropped at the end
+            con.execute("CREATE TEMP TABLE seen (osm_id TEXT PRIMARY KEY) WITHOUT ROWID")
+
+        total = 0
+
+        def flush(batch):
+            nonlocal total
+            with con:
+                con.executemany(UPSERT, batch)
+                if replace:
+                    con.executemany("INSERT OR IGNORE INTO temp.seen VALUES (?)",
+                                    ((row[0],) for row in batch))
+            total += len(batch)
+            print(f"Loaded {total} power features...")
+
+        name = path.name.lower()
+        if name.endswith(('.pbf', '.osm', '.osm.bz2', '.osm.gz', '.o5m')):
+            osm_rows(path, flush, batch_size, index)
+        else:
+            for batch in _batches(geojson_rows(path), batch_size):
+                flush(batch)
+
+        if replace:
+            with con:
+                gone = con.execute(
+                    "DELETE FROM substations WHERE osm_id NOT IN (SELECT osm_id FROM temp.seen)"
+                ).rowcount
+            if gone:
+                print(f"Removed {gone} features missing from {path.name}")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load OSM power infrastructure into the substations table")
+    parser.add_argument("extract", help=".osm.pbf / .osm (needs pyosmium), .geojson or .geojsonseq")
+    parser.add_argument("--db", default=str(DB_PATH))
+    parser.add_argument("--replace", action="store_true",
+                        help="also delete features that aren't in this extract")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--index", default='flex_mem',
+                        help="pyosmium node location index, e.g. dense_file_array,nodes.cache")
+    args = parser.parse_args()
+
+    n = ingest(args.extract, args.db, args.replace, args.batch_size, args.index)
+    print(f"✅ {n} power features loaded into {args.db}")
@@ -1,25 +1,14 @@
-import pandas as pd
+import os
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 import joblib
+from energy_features import FEATURE_COLS, load_features
+from forecast_engine import forecast_batch, latest_feature_rows
+from forecast_table import write_forecast_table
+from forest_compiler import compile_model_dir
+from ttl_cache import file_fingerprint
 
-# Load dataset
-df = pd.read_csv('backend/data/state_energy_summary.csv')
-df = df.sort_values(['State', 'Year'])
-
-# Compute changes and lags
-df['Renewable_change'] = df.groupby('State')['PercentRenewable'].diff()
-df['NonRenewable_change'] = df.groupby('State')['PercentNonRenewable'].diff()
-
-lags = 3
-for lag in range(1, lags+1):
-    df[f'PercentRenewable_lag{lag}'] = df.groupby(
-        'State')['PercentRenewable'].shift(lag)
-    df[f'PercentNonRenewable_lag{lag}'] = df.groupby(
-        'State')['PercentNonRenewable'].shift(lag)
-    df[f'Renewable_change_lag{lag}'] = df.groupby(
-        'State')['Renewable_change'].shift(lag)
-    df[f'NonRenewable_change_lag{lag}'] = df.groupby(
-        'State')['NonRenewable_change'].shift(lag)
+# Load dataset with change and lag features
+df = load_features('backend/data/state_energy_summary.csv').frame()
 
 df['IncreaseRenewable'] = (df['Renewable_change'] >
                            df['NonRenewable_change']).astype(int)
@@ -32,13 +21,7 @@ df['PercentNonRenewable_future'] = df.groupby(
     'State')['PercentNonRenewable'].shift(-forecast_horizon)
 
 # Feature columns
-feature_cols = [
-    'PercentRenewable', 'PercentNonRenewable', 'TotalEnergy',
-    'Renewable_change', 'NonRenewable_change'
-] + [f'PercentRenewable_lag{i}' for i in range(1, lags+1)] + \
-    [f'PercentNonRenewable_lag{i}' for i in range(1, lags+1)] + \
-    [f'Renewable_change_lag{i}' for i in range(1, lags+1)] + \
-    [f'NonRenewable_change_lag{i}' for i in range(1, lags+1)]
+feature_cols = FEATURE_COLS
 
 # Drop rows with missing values
 df_model = df.dropna(subset=['IncreaseRenewable_future',
@@ -69,9 +52,40 @@ reg_nonrenew = RandomForestRegressor(
     n_estimators=200, max_depth=15, random_state=42)
 reg_nonrenew.fit(X_train, y_reg_nonrenew_train)
 
+
+
+def save_model(model, path):
+    # Write next to the target and swap it in, so the server never loads a
+    # half-written file
+    tmp = f'{path}.tmp'
+    joblib.dump(model, tmp)
+    os.replace(tmp, path)
+
+
 # Save models
-joblib.dump(clf, 'backend/models/clf.joblib')
-joblib.dump(reg_renew, 'backend/models/reg_renew.joblib')
-joblib.dump(reg_nonrenew, 'backend/models/reg_nonrenew.joblib')
+save_model(clf, 'backend/models/clf.joblib')
+save_model(reg_renew, 'backend/models/reg_renew.joblib')
+save_model(reg_nonrenew, 'backend/models/reg_nonrenew.joblib')
 
 print("Models trained and saved successfully.")
+
+# Flat NumPy copies of the forests for sklearn-free inference
+compile_model_dir('backend/models')
+
+# Materialize the serving forecasts so the API never runs the models
+forecast_years = 100
+models = {'clf': clf, 'reg_renew': reg_renew, 'reg_nonrenew': reg_nonrenew}
+states, start_years, X_latest, skipped = latest_feature_rows(df, feature_cols)
+preds = forecast_batch(X_latest, forecast_years, models, feature_cols,
+                       backend='compiled')
+
+write_forecast_table(
+    'backend/models/forecasts.db', states, start_years, preds,
+    model_fingerprint=file_fingerprint('backend/models/clf.joblib',
+                                       'backend/models/reg_renew.joblib',
+                                       'backend/models/reg_nonrenew.joblib'),
+    data_fingerprint=file_fingerprint('backend/data/state_energy_summary.csv'))
+
+print(f"Forecast table written for {len(states)} states x {forecast_years} years.")
+if skipped:
+    print(f"Skipped (incomplete features): {', '.join(skipped)}")
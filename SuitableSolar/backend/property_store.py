@@ -0,0 +1,161 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from db import db_signature, read_pool
+
+
+class StoreSnapshot:
+    """
+    One consistent version of the table. Never modified after it's built:
+    a refresh builds a new snapshot and swaps it in, so a reader holding
+    one always sees ids, values, rows and positions that belong together.
+    """
+
+    def __init__(self, ids: np.ndarray, values: np.ndarray, rows: List[object],
+                 positions: Dict[int, int], col_index: Dict[str, int], version: int):
+        self.ids = ids
+        self.values = values
+        self.rows = rows
+        self.positions = positions
+        self.col_index = col_index
+        self.version = version
+        ids.setflags(write=False)
+        values.setflags(write=False)
+
+    def get(self, property_id: int) -> Optional[object]:
+        pos = self.positions.get(property_id)
+        return None if pos is None else self.rows[pos]
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[:, self.col_index[name]]
+
+
+class PropertyStore:
+    """
+    In-memory copy of the ``locations`` table.
+
+    The table is loaded once. Afterwards, whenever the database file changes
+    on disk, only rows whose ``updated_at`` moved are re-read. Numeric
+    columns are kept in a single float matrix (NULL -> NaN) so callers can
+    work on the whole table without touching Python objects, and ``get``
+    is a dict lookup from id to row position.
+
+    Readers work on ``snapshot()``; refreshes never modify a published
+    snapshot, they replace it with a single assignment.
+    """
+
+    def __init__(self, db_path: Path, build_row: Callable[[sqlite3.Row], object],
+                 numeric_cols: List[str]):
+        self.db_path = Path(db_path)
+        self.build_row = build_row
+        self.numeric_cols = list(numeric_cols)
+        self.col_index = {c: i for i, c in enumerate(self.numeric_cols)}
+
+        self._snapshot = StoreSnapshot(
+            np.empty(0, dtype=np.int64), np.empty((0, len(self.numeric_cols)), dtype=np.float64),
+            [], {}, self.col_index, version=0)
+
+        self._signature = None
+        self._watermark: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        # Bumped on every change so derived structures know when to rebuild
+        return self._snapshot.version
+
+    def _numeric(self, row: sqlite3.Row) -> List[float]:
+        return [np.nan if row[c] is None else row[c] for c in self.numeric_cols]
+
+    def _load_all(self, conn: sqlite3.Connection) -> StoreSnapshot:
+        rows = conn.execute("SELECT * FROM locations ORDER BY id").fetchall()
+
+        ids = np.array([r["id"] for r in rows], dtype=np.int64)
+        values = np.array([self._numeric(r) for r in rows],
+                          dtype=np.float64).reshape(len(rows), len(self.numeric_cols))
+        self._watermark = max((r["updated_at"] for r in rows if r["updated_at"]),
+                              default=None)
+        return StoreSnapshot(ids, values, [self.build_row(r) for r in rows],
+                             {int(i): pos for pos, i in enumerate(ids)},
+                             self.col_index, self.version + 1)
+
+    def _apply_changes(self, conn: sqlite3.Connection) -> StoreSnapshot:
+        # Deletes leave no updated_at trace; fall back to a full reload
+        total = conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+
+        # updated_at has one-second resolution, so re-read the watermark
+        # second too; re-applying an unchanged row is harmless.
+        if self._watermark is None:
+            changed = conn.execute("SELECT * FROM locations").fetchall()
+        else:
+            changed = conn.execute(
+                "SELECT * FROM locations WHERE updated_at >= ?",
+                (self._watermark,)).fetchall()
+
+        # Work on copies; the published snapshot may be in use
+        old = self._snapshot
+        values = old.values.copy()
+        rows = list(old.rows)
+        positions = dict(old.positions)
+        watermark = self._watermark
+
+        new_ids, new_values, new_rows = [], [], []
+        for r in changed:
+            pos = positions.get(r["id"])
+            if pos is None:
+                new_ids.append(r["id"])
+                new_values.append(self._numeric(r))
+                new_rows.append(self.build_row(r))
+            else:
+                values[pos] = self._numeric(r)
+                rows[pos] = self.build_row(r)
+            if r["updated_at"] and (watermark is None or r["updated_at"] > watermark):
+                watermark = r["updated_at"]
+
+        ids = old.ids
+        if new_ids:
+            start = len(rows)
+            ids = np.concatenate([ids, np.array(new_ids, dtype=np.int64)])
+            values = np.vstack([values, np.array(new_values, dtype=np.float64)])
+            rows.extend(new_rows)
+            for offset, i in enumerate(new_ids):
+                positions[int(i)] = start + offset
+
+        if total != len(rows):
+            return self._load_all(conn)
+        self._watermark = watermark
+        return StoreSnapshot(ids, values, rows, positions, self.col_index, self.version + 1)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Sync with the database if it changed. Returns True if it did."""
+        signature = db_signature(self.db_path)
+        if not force and self._signature is not None and signature == self._signature:
+            return False
+
+        with self._lock:
+            signature = db_signature(self.db_path)
+            if not force and signature == self._signature:
+                return False
+            with read_pool(self.db_path).connection() as conn:
+                if self._signature is None or force:
+                    snapshot = self._load_all(conn)
+                else:
+                    snapshot = self._apply_changes(conn)
+            self._snapshot = snapshot
+            self._signature = signature
+        return True
+
+    def snapshot(self) -> StoreSnapshot:
+        """The current table, refreshed first if the database changed."""
+        self.refresh()
+        return self._snapshot
+
+    def all(self) -> List[object]:
+        return self.snapshot().rows
+
+    def get(self, property_id: int) -> Optional[object]:
+        return self.snapshot().get(property_id)
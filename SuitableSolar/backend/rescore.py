@@ -0,0 +1,166 @@
+"""
+Incremental solar_score refresh for the locations table.
+
+The score of a row depends on its own columns and on three dataset-wide
+normalizers (min/max Annual_GHI and max acres/price). Those are read from
+indexes on every run (see schema.py), so they cost a few page reads. If
+they're unchanged since the last run, only rows past the stored
+``(updated_at, id)`` watermark are rescored. Otherwise every row is. Either
+way, only scores that actually changed are written, in batched
+transactions.
+
+``updated_at`` has one-second resolution, so the watermark only advances
+over seconds that are already over: later writes can't land in them.
+Rows this job rewrites get a fresh ``updated_at`` from
+``trg_locations_touch`` and are checked once more by the next run, which
+finds nothing to write, so they don't come back after that.
+
+    python rescore.py [--full] [--batch-size N]
+"""
+import argparse
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from CONSTANTS import DATABASE
+from compute_score import SCORE_INPUTS, score_rows
+
+DB_PATH = Path(__file__).with_name(DATABASE)
+BATCH_SIZE = 5000
+
+NORMALIZERS = ["min_ghi", "max_ghi", "max_value_efficiency"]
+
+
+def read_normalizers(con: sqlite3.Connection) -> Dict[str, float]:
+    """
+    Same values as compute_score.compute_normalizers over the whole table,
+    from indexed min/max lookups. pandas gives inf for acres/0, which
+    SQLite turns into NULL, so that case is checked separately.
+    """
+    min_ghi, max_ghi, max_eff, has_inf = con.execute("""
+        SELECT (SELECT MIN(Annual_GHI) FROM locations),
+               (SELECT MAX(Annual_GHI) FROM locations),
+               (SELECT MAX(acres / price) FROM locations),
+               EXISTS (SELECT 1 FROM locations WHERE price = 0 AND acres > 0)
+    """).fetchone()
+    if has_inf:
+        max_eff = np.inf
+    return {name: np.nan if v is None else float(v)
+            for name, v in zip(NORMALIZERS, (min_ghi, max_ghi, max_eff))}
+
+
+def _same(a: float, b: float) -> bool:
+    return a == b or (np.isnan(a) and np.isnan(b))
+
+
+def read_watermark(con: sqlite3.Connection) -> Tuple[Optional[str], Optional[int]]:
+    """
+    ``(updated_at, id)`` of the newest row written before the current
+    second. Rows still being written this second stay past it.
+    """
+    row = con.execute("""
+        SELECT updated_at, id FROM locations
+        WHERE updated_at < datetime('now')
+        ORDER BY updated_at DESC, id DESC LIMIT 1
+    """).fetchone()
+    return (None, None) if row is None else row
+
+
+def _changed_chunks(con: sqlite3.Connection, since: Optional[Tuple[str, Optional[int]]],
+                    until: Tuple[Optional[str], Optional[int]],
+                    batch_size: int) -> Iterator[pd.DataFrame]:
+    cols = f"id, updated_at, solar_score, {', '.join(SCORE_INPUTS)}"
+    if since is None:
+        # Every row, a page of ids at a time
+        last_id = -1
+        while True:
+            chunk = pd.read_sql_query(f"""
+                SELECT {cols} FROM locations WHERE id > :last_id
+                ORDER BY id LIMIT :limit
+            """, con, params={"last_id": last_id, "limit": batch_size})
+            if chunk.empty:
+                return
+            last_id = int(chunk["id"].iloc[-1])
+            yield chunk
+
+    # Rows in ((since), (until)] in (updated_at, id) order, paged by keyset
+    # so idx_locations_updated_at (which ends in the rowid) serves both the
+    # range and the order. Rows past ``until``, including the ones this run
+    # rewrites, are left to the next run.
+    at, last_id = since
+    # legacy watermark without an id: rescan its second
+    last_id = -1 if last_id is None else last_id
+    bound = "" if until[0] is None else "AND (updated_at, id) <= (:until_at, :until_id)"
+    while True:
+        chunk = pd.read_sql_query(f"""
+            SELECT {cols} FROM locations
+            WHERE (updated_at, id) > (:at, :last_id) {bound}
+            ORDER BY updated_at, id LIMIT :limit
+        """, con, params={"at": at, "last_id": last_id, "until_at": until[0],
+                          "until_id": until[1], "limit": batch_size})
+        if chunk.empty:
+            return
+        at, last_id = chunk["updated_at"].iloc[-1], int(chunk["id"].iloc[-1])
+        yield chunk
+
+
+def rescore(db_path=DB_PATH, full: bool = False, batch_size: int = BATCH_SIZE) -> dict:
+    """Bring solar_score up to date. Returns counts of what was done."""
+    with closing(sqlite3.connect(db_path)) as con, con:
+        norms = read_normalizers(con)
+        state = con.execute(
+            "SELECT min_ghi, max_ghi, max_value_efficiency, watermark, watermark_id"
+            " FROM score_state"
+        ).fetchone()
+        # Read before scoring: rows touched while we run (including by our
+        # own writes, via trg_locations_touch) are picked up next time
+        watermark_at, watermark_id = read_watermark(con)
+
+        if state is not None and not full:
+            old = {name: np.nan if v is None else v for name, v in zip(NORMALIZERS, state)}
+            full = not all(_same(old[n], norms[n]) for n in NORMALIZERS)
+        else:
+            full = True
+        since = None if full or state[3] is None else (state[3], state[4])
+
+        scanned = written = 0
+        for chunk in _changed_chunks(con, since, (watermark_at, watermark_id), batch_size):
+            new = score_rows(chunk, norms)
+            old = chunk["solar_score"].to_numpy(dtype=float)
+            changed = ~((new == old) | (np.isnan(new) & np.isnan(old)))
+            scanned += len(chunk)
+            if changed.any():
+                # NaN binds as NULL
+                with con:
+                    con.executemany(
+                        "UPDATE locations SET solar_score = ? WHERE id = ?",
+                        zip(new[changed].tolist(), chunk["id"].to_numpy()[changed].tolist()))
+                written += int(changed.sum())
+
+        with con:
+            con.execute("""
+                INSERT INTO score_state
+                  (id, min_ghi, max_ghi, max_value_efficiency, watermark, watermark_id)
+                VALUES (1, :min_ghi, :max_ghi, :max_value_efficiency, :watermark, :watermark_id)
+                ON CONFLICT (id) DO UPDATE SET
+                  min_ghi = excluded.min_ghi, max_ghi = excluded.max_ghi,
+                  max_value_efficiency = excluded.max_value_efficiency,
+                  watermark = excluded.watermark, watermark_id = excluded.watermark_id
+            """, {**norms, "watermark": watermark_at, "watermark_id": watermark_id})
+
+    return {"full": full, "scanned": scanned, "written": written}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore changed locations")
+    parser.add_argument("--full", action="store_true", help="rescore every row")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    result = rescore(full=args.full, batch_size=args.batch_size)
+    kind = "full" if result["full"] else "incremental"
+    print(f"✅ {kind} rescore: {result['scanned']} rows checked, {result['written']} updated")
@@ -1,7 +1,10 @@
 # Create locations.db and table
+import argparse
 import sqlite3
+from contextlib import closing
 from pathlib import Path
 from CONSTANTS import DATABASE
+from db import set_journal_mode
 
 DB_PATH = Path(__file__).with_name(DATABASE)
 
@@ -54,6 +57,135 @@ CREATE INDEX IF NOT EXISTS idx_locations_Annual_GHI   ON locations (Annual_GHI);
 CREATE INDEX IF NOT EXISTS idx_locations_Annual_DNI   ON locations (Annual_DNI);
 CREATE INDEX IF NOT EXISTS idx_locations_tilt_deg     ON locations (tilt_deg);
 
+-- let rescore.py read its normalizers and changed rows without a table scan
+CREATE INDEX IF NOT EXISTS idx_locations_price        ON locations (price);
+CREATE INDEX IF NOT EXISTS idx_locations_value_eff    ON locations (acres / price);
+CREATE INDEX IF NOT EXISTS idx_locations_updated_at   ON locations (updated_at);
+
+-- normalizers and (updated_at, id) watermark of the last rescore.py run
+CREATE TABLE IF NOT EXISTS score_state (
+  id                      INTEGER PRIMARY KEY CHECK (id = 1),
+  min_ghi                 REAL,
+  max_ghi                 REAL,
+  max_value_efficiency    REAL,
+  watermark               TEXT,
+  watermark_id            INTEGER
+);
+
+-- R*-tree over the points so bounding-box queries only touch candidates
+CREATE VIRTUAL TABLE IF NOT EXISTS locations_rtree USING rtree(
+  id,
+  min_lat, max_lat,
+  min_lon, max_lon
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_rtree_insert
+AFTER INSERT ON locations
+FOR EACH ROW
+BEGIN
+  INSERT OR REPLACE INTO locations_rtree
+  VALUES (NEW.id, NEW.Latitude, NEW.Latitude, NEW.Longitude, NEW.Longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_rtree_update
+AFTER UPDATE OF id, Latitude, Longitude ON locations
+FOR EACH ROW
+BEGIN
+  DELETE FROM locations_rtree WHERE id = OLD.id;
+  INSERT INTO locations_rtree
+  VALUES (NEW.id, NEW.Latitude, NEW.Latitude, NEW.Longitude, NEW.Longitude);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_rtree_delete
+AFTER DELETE ON locations
+FOR EACH ROW
+BEGIN
+  DELETE FROM locations_rtree WHERE id = OLD.id;
+END;
+
+-- backfill rows loaded before the index existed
+INSERT INTO locations_rtree
+SELECT id, Latitude, Latitude, Longitude, Longitude FROM locations
+WHERE id NOT IN (SELECT id FROM locations_rtree);
+
+-- Trigram full-text index on Address for substring/type-ahead search.
+-- External content: the text lives only in locations.
+CREATE VIRTUAL TABLE IF NOT EXISTS locations_fts USING fts5(
+  Address,
+  content='locations',
+  content_rowid='id',
+  tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_fts_insert
+AFTER INSERT ON locations
+FOR EACH ROW
+BEGIN
+  INSERT INTO locations_fts (rowid, Address) VALUES (NEW.id, NEW.Address);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_fts_update
+AFTER UPDATE OF id, Address ON locations
+FOR EACH ROW
+BEGIN
+  INSERT INTO locations_fts (locations_fts, rowid, Address) VALUES ('delete', OLD.id, OLD.Address);
+  INSERT INTO locations_fts (rowid, Address) VALUES (NEW.id, NEW.Address);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_fts_delete
+AFTER DELETE ON locations
+FOR EACH ROW
+BEGIN
+  INSERT INTO locations_fts (locations_fts, rowid, Address) VALUES ('delete', OLD.id, OLD.Address);
+END;
+
+-- OSM power infrastructure (loaded by osm_ingest.py), one row per feature
+-- at its centroid
+CREATE TABLE IF NOT EXISTS substations (
+  id                      INTEGER PRIMARY KEY,
+  osm_id                  TEXT NOT NULL UNIQUE,   -- "node/123", "way/456", "relation/789"
+  type                    TEXT NOT NULL,          -- power=* tag
+  name                    TEXT,
+  voltage                 TEXT,
+  operator                TEXT,
+  lat                     REAL NOT NULL,
+  lon                     REAL NOT NULL,
+
+  CHECK (type IN ('substation', 'station', 'plant', 'transformer', 'switch')),
+  CHECK (lat BETWEEN -90 AND 90),
+  CHECK (lon BETWEEN -180 AND 180)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS substations_rtree USING rtree(
+  id,
+  min_lat, max_lat,
+  min_lon, max_lon
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_substations_rtree_insert
+AFTER INSERT ON substations
+FOR EACH ROW
+BEGIN
+  INSERT OR REPLACE INTO substations_rtree
+  VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_substations_rtree_update
+AFTER UPDATE OF id, lat, lon ON substations
+FOR EACH ROW
+BEGIN
+  DELETE FROM substations_rtree WHERE id = OLD.id;
+  INSERT INTO substations_rtree
+  VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_substations_rtree_delete
+AFTER DELETE ON substations
+FOR EACH ROW
+BEGIN
+  DELETE FROM substations_rtree WHERE id = OLD.id;
+END;
+
 -- trigger to keep updated_at fresh
 CREATE TRIGGER IF NOT EXISTS trg_locations_touch
 AFTER UPDATE ON locations
@@ -64,12 +196,32 @@ END;
 """
 
 
-def main():
+def main(journal_mode=None):
     DB_PATH.touch(exist_ok=True)
-    with sqlite3.connect(DB_PATH) as con:
+    with closing(sqlite3.connect(DB_PATH)) as con, con:
+        has_fts = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'locations_fts'").fetchone()
         con.executescript(DDL)
+        # columns added after a table was first created
+        cols = {row[1] for row in con.execute("PRAGMA table_info(score_state)")}
+        if "watermark_id" not in cols:
+            con.execute("ALTER TABLE score_state ADD COLUMN watermark_id INTEGER")
+        if not has_fts:
+            # index rows loaded before the FTS table existed
+            con.execute("INSERT INTO locations_fts (locations_fts) VALUES ('rebuild')")
+    if journal_mode:
+        # Stored in the file. WAL suits a writable deployment with live
+        # writers; read-only filesystems need the default rollback journal.
+        mode = set_journal_mode(DB_PATH, journal_mode)
+        print(f"Journal mode: {mode}")
     print(f"✅ Schema ready at {DB_PATH}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create or migrate locations.db")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--wal", dest="journal_mode", action="store_const", const="wal",
+                       help="switch the database to WAL (needs a writable directory)")
+    group.add_argument("--no-wal", dest="journal_mode", action="store_const", const="delete",
+                       help="switch back to the rollback journal")
+    main(parser.parse_args().journal_mode)
@@ -0,0 +1,84 @@
+import threading
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from compute_score import FACTORS, compute_normalizers, factor_matrix
+from property_store import PropertyStore, StoreSnapshot
+
+
+class ScoringSnapshot:
+    """
+    Factor matrix built from one store snapshot. Never modified after it's
+    built; ``top`` filters and returns positions in that same snapshot.
+    """
+
+    def __init__(self, snapshot: StoreSnapshot):
+        self.snapshot = snapshot
+        df = pd.DataFrame(snapshot.values, columns=list(snapshot.col_index), copy=False)
+        factors = factor_matrix(df, compute_normalizers([df]))
+        self.valid = ~np.isnan(factors).any(axis=1)
+        self.factors = np.ascontiguousarray(np.nan_to_num(factors), dtype=np.float32)
+
+    def top(self, weights: Sequence[float], k: int,
+            where: Optional[Callable[[StoreSnapshot], np.ndarray]] = None
+            ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Snapshot positions and scores (0–100) of the k best properties under
+        ``weights`` (one per factor, normalized to sum to 1), best first.
+        ``where(snapshot)`` may return a boolean row mask to rank only part
+        of the table. Also returns the number of rows that were eligible.
+
+        Raises ValueError for negative or all-zero weights.
+        """
+        w = np.asarray(weights, dtype=np.float64)
+        if w.shape != (len(FACTORS),) or (w < 0).any() or w.sum() <= 0:
+            raise ValueError(f"Expected {len(FACTORS)} non-negative weights, not all zero")
+
+        eligible = self.valid if where is None else self.valid & where(self.snapshot)
+        candidates = np.flatnonzero(eligible)
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32), 0
+
+        w = (w / w.sum() * 100).astype(np.float32)
+        scores = np.clip((self.factors @ w)[candidates], 0, 100)
+
+        k = min(k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(k)
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return candidates[best], scores[best], len(candidates)
+
+
+class ScoringIndex:
+    """
+    The six normalized solar-score factors of every property, kept in
+    memory as a float32 matrix and rebuilt only when the store's version
+    changes. Scoring with any weighting is then one matrix-vector product,
+    and the top N come from argpartition rather than a full sort.
+    Properties with a missing factor are never ranked.
+    """
+
+    def __init__(self, store: PropertyStore):
+        self.store = store
+        self._current: Optional[ScoringSnapshot] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> ScoringSnapshot:
+        snapshot = self.store.snapshot()
+        built = self._current
+        if built is not None and built.snapshot is snapshot:
+            return built
+        with self._lock:
+            if self._current is None or self._current.snapshot.version < snapshot.version:
+                self._current = ScoringSnapshot(snapshot)
+            return self._current
+
+    def ensure_current(self):
+        self.current()
+
+    def top(self, weights: Sequence[float], k: int,
+            where: Optional[Callable[[StoreSnapshot], np.ndarray]] = None
+            ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """See ScoringSnapshot.top; positions index ``current().snapshot``."""
+        return self.current().top(weights, k, where)
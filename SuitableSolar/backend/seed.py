@@ -34,7 +34,6 @@ def main():
         raise SystemExit(f"CSV not found: {CSV_PATH}")
 
     with sqlite3.connect(DB_PATH) as con, CSV_PATH.open(newline="", encoding="utf-8") as f:
-        con.execute("PRAGMA journal_mode=WAL;")
         rdr = csv.DictReader(f)
         rows = 0
         placeholders = ",".join([f":{c}" for c in TABLE_COLS])
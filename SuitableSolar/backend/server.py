@@ -3,27 +3,49 @@ from fastapi.middleware.cors import CORSMiddleware
 import sqlite3
 from pathlib import Path
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import joblib
-from forecastModel import multi_year_forecast
+from forecast_engine import TARGETS, multi_year_forecast, forecast_batch, latest_feature_rows
+from forecast_table import load_forecast_table
+from energy_features import FEATURE_COLS, LAGS, load_features
+from forest_compiler import as_compiled, load_compiled_models
 import pandas as pd
 import os
-from fastapi.responses import JSONResponse, StreamingResponse
+import threading
+import time
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from fastapi.exception_handlers import RequestValidationError
 from fastapi import Request
 from fastapi.exceptions import RequestValidationError
-from sklearn.preprocessing import StandardScaler
-from sklearn.neighbors import NearestNeighbors
+from chart_renderer import ChartRenderer, RendererBusy
+from chart_cache import ChartDiskCache, chart_key
 import numpy as np
-from forecast_chart import create_forecast_figure
-import matplotlib.pyplot as plt
-import io
+from contextlib import asynccontextmanager
+from property_store import PropertyStore
+from similarity_index import SimilarityIndex
+from scoring_index import ScoringIndex
+from compute_score import FACTORS, WEIGHTS
+from ttl_cache import TTLCache, file_fingerprint
 
 
 DB_PATH = Path(__file__).parent / "locations.db"
 
 
-app = FastAPI(title="Solar Land API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the locations table once; requests only pick up changed rows
+    if DB_PATH.exists():
+        property_store.refresh()
+        similarity_index.ensure_current()
+        scoring_index.ensure_current()
+    forecast_inputs()
+    await chart_renderer.start_async()
+    yield
+    chart_renderer.shutdown()
+
+
+app = FastAPI(title="Solar Land API", lifespan=lifespan)
 
 
 app.add_middleware(
@@ -91,43 +113,28 @@ def map_db_row_to_property_dict(row: sqlite3.Row) -> dict:
     }
 
 
-def fetch_properties() -> List[Property]:
-    if not DB_PATH.exists():
-        raise FileNotFoundError(f"Database not found at {DB_PATH}")
+NUMERIC_COLS = [
+    "Latitude", "Longitude", "Annual_GHI", "Annual_DNI", "Annual_Tilt_Latitude",
+    "GHI_jan", "GHI_feb", "GHI_mar", "GHI_apr", "GHI_may", "GHI_jun",
+    "GHI_jul", "GHI_aug", "GHI_sep", "GHI_oct", "GHI_nov", "GHI_dec",
+    "nearest_substation_km", "tilt_deg", "solar_score", "acres", "price",
+]
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+property_store = PropertyStore(
+    DB_PATH,
+    build_row=lambda row: Property(**map_db_row_to_property_dict(row)),
+    numeric_cols=NUMERIC_COLS,
+)
 
-    cur.execute("SELECT * FROM locations")
-    rows = cur.fetchall()
-    conn.close()
 
-    properties = []
-    for row in rows:
-        data = map_db_row_to_property_dict(row)
-        properties.append(Property(**data))
-    return properties
+similarity_index = SimilarityIndex(property_store)
+scoring_index = ScoringIndex(property_store)
+chart_renderer = ChartRenderer()
+chart_cache = ChartDiskCache()
 
 
 def fetch_properties() -> List[Property]:
-    # Check if database file exists
-    if not DB_PATH.exists():
-        raise FileNotFoundError(f"Database not found at {DB_PATH}")
-
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    cur.execute("SELECT * FROM locations")
-    rows = cur.fetchall()
-    conn.close()
-
-    properties = []
-    for row in rows:
-        data = map_db_row_to_property_dict(row)
-        properties.append(Property(**data))
-    return properties
+    return property_store.all()
 
 
 @app.get("/properties", response_model=List[Property])
@@ -141,60 +148,117 @@ def get_properties():
 @app.get("/properties/{property_id}", response_model=Property)
 def get_property(property_id: int):
     try:
-        props = fetch_properties()
-        for p in props:
-            if p.id == property_id:
-                return p
-        raise HTTPException(status_code=404, detail="Property not found")
+        prop = property_store.get(property_id)
+        if prop is None:
+            raise HTTPException(status_code=404, detail="Property not found")
+        return prop
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
-clf = joblib.load(os.path.join(base_dir, 'models', 'clf.joblib'))
-reg_renew = joblib.load(os.path.join(base_dir, 'models', 'reg_renew.joblib'))
-reg_nonrenew = joblib.load(os.path.join(
-    base_dir, 'models', 'reg_nonrenew.joblib'))
-
-models = {'clf': clf, 'reg_renew': reg_renew, 'reg_nonrenew': reg_nonrenew}
-
-# Preprocess df by adding change and lag columns
-df = pd.read_csv('data/state_energy_summary.csv')
-df = df.sort_values(['State', 'Year'])
-
-# Calculate change columns grouped by state
-df['Renewable_change'] = df.groupby('State')['PercentRenewable'].diff()
-df['NonRenewable_change'] = df.groupby('State')['PercentNonRenewable'].diff()
-
-lags = 3
-for lag in range(1, lags + 1):
-    df[f'PercentRenewable_lag{lag}'] = df.groupby(
-        'State')['PercentRenewable'].shift(lag)
-    df[f'PercentNonRenewable_lag{lag}'] = df.groupby(
-        'State')['PercentNonRenewable'].shift(lag)
-    df[f'Renewable_change_lag{lag}'] = df.groupby(
-        'State')['Renewable_change'].shift(lag)
-    df[f'NonRenewable_change_lag{lag}'] = df.groupby(
-        'State')['NonRenewable_change'].shift(lag)
-
-feature_cols = [
-    "PercentRenewable", "PercentNonRenewable", "TotalEnergy",
-    "Renewable_change", "NonRenewable_change"
-]
-feature_cols += [f"PercentRenewable_lag{i}" for i in range(1, lags + 1)]
-feature_cols += [f"PercentNonRenewable_lag{i}" for i in range(1, lags + 1)]
-feature_cols += [f"Renewable_change_lag{i}" for i in range(1, lags + 1)]
-feature_cols += [f"NonRenewable_change_lag{i}" for i in range(1, lags + 1)]
+MODEL_PATHS = {name: os.path.join(base_dir, 'models', f'{name}.joblib')
+               for name in ('clf', 'reg_renew', 'reg_nonrenew')}
+DATA_CSV = os.path.join(base_dir, 'data', 'state_energy_summary.csv')
+FORECAST_TABLE = os.path.join(base_dir, 'models', 'forecasts.db')
+
+MAX_FORECAST_YEARS = 100
+forecast_cache = TTLCache(maxsize=256, ttl=6 * 3600)
+
+# How often requests re-check the model and data files for changes
+INPUT_CHECK_SECONDS = 5.0
+
+
+class ForecastInputs:
+    """
+    Everything forecasts are computed from, for one version of the model
+    and data files: their fingerprints, the feature table, each state's
+    starting row, the materialized forecasts and (loaded on first use)
+    the forests. Swapped whole when the files change, so one request
+    never mixes versions.
+    """
+
+    def __init__(self, model_fingerprint: str, data_fingerprint: str,
+                 table_fingerprint: Optional[str] = None):
+        self.model_fingerprint = model_fingerprint
+        self.data_fingerprint = data_fingerprint
+        # predictionModel.py writes the table after the models; watching it
+        # too picks the new table up even if a check fell in between
+        self.table_fingerprint = table_fingerprint
+
+        # Written by predictionModel.py; None if missing or built from other inputs
+        self.materialized = load_forecast_table(
+            FORECAST_TABLE, model_fingerprint, data_fingerprint) or {}
+
+        # Shared, memory-mapped lag/change feature table
+        self.energy_features = load_features(DATA_CSV)
+        # Starting feature row of every state, stacked for the batch engine
+        (self.batch_states, self.batch_start_years, self.batch_features,
+         self.batch_skipped) = latest_feature_rows(self.energy_features.frame(), FEATURE_COLS)
+
+        self._models = None
+        self._lock = threading.Lock()
+
+    def models(self):
+        """
+        Load the forests on first use; only needed when a forecast isn't
+        materialized. Prefers the compiled .npz forests (no sklearn needed) and
+        otherwise compiles the joblib models in memory.
+        """
+        if self._models is None:
+            with self._lock:
+                if self._models is None:
+                    compiled = load_compiled_models(os.path.join(base_dir, 'models'))
+                    if compiled is None:
+                        compiled = {name: as_compiled(joblib.load(path))
+                                    for name, path in MODEL_PATHS.items()}
+                    self._models = compiled
+        return self._models
+
+
+def _table_fingerprint() -> Optional[str]:
+    try:
+        return file_fingerprint(FORECAST_TABLE)
+    except FileNotFoundError:
+        return None
 
 
-@app.get("/forecast")
-def get_forecast(
-    state: str = Query(..., min_length=2, max_length=2),
-    years_ahead: int = Query(..., ge=1, le=100)
-):
-    state = state.upper()
-    state_data = df[df['State'] == state].sort_values('Year')
+_inputs: Optional[ForecastInputs] = None
+_inputs_checked = 0.0
+_inputs_lock = threading.Lock()
+
+
+def forecast_inputs() -> ForecastInputs:
+    """
+    Current ForecastInputs. At most every INPUT_CHECK_SECONDS the models,
+    data and forecast table are fingerprinted again (a stat each unless
+    they changed) and, if a fingerprint moved, everything is reloaded. Retrained models or new
+    data are picked up without a restart.
+    """
+    global _inputs, _inputs_checked
+    now = time.monotonic()
+    if _inputs is not None and now - _inputs_checked < INPUT_CHECK_SECONDS:
+        return _inputs
+    with _inputs_lock:
+        if _inputs is None or now - _inputs_checked >= INPUT_CHECK_SECONDS:
+            fingerprints = (file_fingerprint(*MODEL_PATHS.values()), file_fingerprint(DATA_CSV),
+                            _table_fingerprint())
+            if _inputs is None or fingerprints != (_inputs.model_fingerprint, _inputs.data_fingerprint,
+                                                   _inputs.table_fingerprint):
+                _inputs = ForecastInputs(*fingerprints)
+            _inputs_checked = now
+        return _inputs
+
+
+lags = LAGS
+feature_cols = FEATURE_COLS
+
+
+def latest_state_features(state: str, inputs: ForecastInputs):
+    state_data = inputs.energy_features.state_frame(state)
 
     if state_data.empty:
         raise HTTPException(status_code=404, detail="State data not found")
@@ -208,35 +272,118 @@ def get_forecast(
         raise HTTPException(
             status_code=500, detail=f"Missing required data columns: {missing_cols}")
 
-    initial_features_df = latest_row[feature_cols].to_frame().T
+    return latest_row[feature_cols].to_frame().T, int(latest_row['Year'])
+
+
+def forecast_trajectory(state: str, years_ahead: int,
+                        inputs: Optional[ForecastInputs] = None) -> pd.DataFrame:
+    """
+    First ``years_ahead`` rows of the state's forecast. The recursion is
+    deterministic, so one cached MAX_FORECAST_YEARS run answers every horizon.
+    """
+    inputs = inputs or forecast_inputs()
+    trajectory = inputs.materialized.get(state)
+    if trajectory is not None and len(trajectory) >= years_ahead:
+        return trajectory.iloc[:years_ahead]
+
+    key = (state, inputs.model_fingerprint, inputs.data_fingerprint)
+    trajectory = forecast_cache.get(key)
+    if trajectory is None:
+        initial_features_df, start_year = latest_state_features(state, inputs)
+        trajectory = multi_year_forecast(
+            initial_features_df=initial_features_df,
+            start_year=start_year,
+            years_ahead=MAX_FORECAST_YEARS,
+            models=inputs.models(),
+            feature_cols=feature_cols,
+            lags=lags
+        )
+        forecast_cache.set(key, trajectory)
+    return trajectory.iloc[:years_ahead]
 
-    start_year = int(latest_row['Year'])
 
-    forecast_df = multi_year_forecast(
-        initial_features_df=initial_features_df,
-        start_year=start_year,
-        years_ahead=years_ahead,
-        models=models,
-        feature_cols=feature_cols,
-        lags=lags
-    )
+@app.get("/forecast")
+def get_forecast(
+    state: str = Query(..., min_length=2, max_length=2),
+    years_ahead: int = Query(..., ge=1, le=MAX_FORECAST_YEARS)
+):
+    state = state.upper()
+    inputs = forecast_inputs()
+    forecast_df = forecast_trajectory(state, years_ahead, inputs)
 
+    current_percent_renewable = inputs.energy_features.state_frame(
+        state)['PercentRenewable'].iloc[-1]
     avg_percent_renewable = forecast_df['Pred_PercentRenewable'].mean()
-    predicted_increase = avg_percent_renewable - \
-        initial_features_df['PercentRenewable'].iloc[0]
+    predicted_increase = avg_percent_renewable - current_percent_renewable
 
     return {
-        "current_percent_renewable": initial_features_df['PercentRenewable'].iloc[0],
+        "current_percent_renewable": current_percent_renewable,
         "average_forecast_percent_renewable": avg_percent_renewable,
         "predicted_increase": predicted_increase
     }
 
 
+@app.get("/forecast/cache_stats")
+def get_forecast_cache_stats():
+    return forecast_cache.stats()
+
+
+@app.get("/forecast/batch")
+def get_forecast_batch(
+    years_ahead: int = Query(..., ge=1, le=MAX_FORECAST_YEARS),
+    states: Optional[List[str]] = Query(None)
+):
+    inputs = forecast_inputs()
+    batch_states = inputs.batch_states
+    batch_features = inputs.batch_features
+    if states:
+        wanted = {s.upper() for s in states}
+        rows = [i for i, s in enumerate(batch_states) if s in wanted]
+        missing = sorted(wanted - set(batch_states))
+        if not rows:
+            raise HTTPException(status_code=404, detail="State data not found")
+    else:
+        rows = list(range(len(batch_states)))
+        missing = []
+
+    states = [batch_states[i] for i in rows]
+    if all(s in inputs.materialized for s in states):
+        preds = {t: np.stack([inputs.materialized[s][t].to_numpy()[:years_ahead]
+                              for s in states])
+                 for t in TARGETS}
+    else:
+        preds = forecast_batch(
+            batch_features[rows], years_ahead, inputs.models(), feature_cols)
+
+    current = batch_features[rows, feature_cols.index('PercentRenewable')]
+    averages = preds['Pred_PercentRenewable'].mean(axis=1)
+
+    forecasts = {}
+    for j, i in enumerate(rows):
+        start_year = int(inputs.batch_start_years[i])
+        forecasts[batch_states[i]] = {
+            "current_percent_renewable": float(current[j]),
+            "average_forecast_percent_renewable": float(averages[j]),
+            "predicted_increase": float(averages[j] - current[j]),
+            "years": list(range(start_year + 1, start_year + years_ahead + 1)),
+            "pred_percent_renewable": preds['Pred_PercentRenewable'][j].tolist(),
+            "pred_percent_nonrenewable": preds['Pred_PercentNonRenewable'][j].tolist(),
+            "pred_increase_renewable": preds['Pred_IncreaseRenewable'][j].tolist(),
+        }
+
+    return {
+        "years_ahead": years_ahead,
+        "forecasts": forecasts,
+        "skipped": sorted(set(inputs.batch_skipped) | set(missing)),
+    }
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=exc.headers,
     )
 
 
@@ -248,77 +395,259 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
+class SimilarPropertiesRequest(BaseModel):
+    ids: List[int]
+    k: int = 3
+
+
+def similar_to(property_ids: List[int], k: int) -> List[List[dict]]:
+    # Positions and rows must come from the same snapshot
+    index = similarity_index.current()
+    try:
+        results = index.query(property_ids, k)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Property not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    rows = index.snapshot.rows
+    return [
+        [{"property": rows[pos], "similarity_distance": float(dist)}
+         for pos, dist in zip(positions, distances)]
+        for positions, distances in results
+    ]
+
+
+# Declared before the {property_id} route so "batch" isn't parsed as an id
+@app.post("/similar-properties/batch")
+def get_similar_properties_batch(body: SimilarPropertiesRequest):
+    if body.k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1")
+    try:
+        similar = similar_to(body.ids, body.k)
+        return {pid: items for pid, items in zip(body.ids, similar)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/similar-properties/{property_id}")
 def get_similar_properties(property_id: int, k: int = 3):
+    if k < 1:
+        raise HTTPException(status_code=400, detail="k must be at least 1")
     try:
-        # Get all properties
-        properties = fetch_properties()
+        return similar_to([property_id], k)[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Find the target property
-        target_property = None
-        for p in properties:
-            if p.id == property_id:
-                target_property = p
-                break
 
-        if not target_property:
-            raise HTTPException(status_code=404, detail="Property not found")
+class ScoreWeights(BaseModel):
+    irradiance: float = WEIGHTS[0]
+    stability: float = WEIGHTS[1]
+    latitude: float = WEIGHTS[2]
+    tilt: float = WEIGHTS[3]
+    distance: float = WEIGHTS[4]
+    value: float = WEIGHTS[5]
+
+
+class RankFilters(BaseModel):
+    min_latitude: Optional[float] = None
+    max_latitude: Optional[float] = None
+    min_longitude: Optional[float] = None
+    max_longitude: Optional[float] = None
+    min_annual_ghi: Optional[float] = None
+    max_nearest_substation_km: Optional[float] = None
+    max_tilt_deg: Optional[float] = None
+    min_acres: Optional[float] = None
+    max_price: Optional[float] = None
+
+
+class RankRequest(BaseModel):
+    weights: ScoreWeights = ScoreWeights()
+    filters: RankFilters = RankFilters()
+    limit: int = Field(20, ge=1, le=500)
+
+
+# filter field -> (store column, keep rows where column >= / <= value)
+RANK_FILTERS = {
+    "min_latitude": ("Latitude", np.greater_equal),
+    "max_latitude": ("Latitude", np.less_equal),
+    "min_longitude": ("Longitude", np.greater_equal),
+    "max_longitude": ("Longitude", np.less_equal),
+    "min_annual_ghi": ("Annual_GHI", np.greater_equal),
+    "max_nearest_substation_km": ("nearest_substation_km", np.less_equal),
+    "max_tilt_deg": ("tilt_deg", np.less_equal),
+    "min_acres": ("acres", np.greater_equal),
+    "max_price": ("price", np.less_equal),
+}
+
+
+@app.post("/properties/rank")
+def rank_properties(body: RankRequest):
+    """
+    Top properties under a custom weighting of the solar score factors.
+    Weights are relative; they're normalized to sum to 1 so scores stay
+    on the 0–100 scale of solar_score.
+    """
+    filters = {name: value for name, value in body.filters.model_dump().items()
+               if value is not None}
+
+    def where(snapshot):
+        mask = np.ones(len(snapshot.ids), dtype=bool)
+        for name, value in filters.items():
+            column, keep = RANK_FILTERS[name]
+            # NaN compares False, so rows missing a filtered value drop out
+            mask &= keep(snapshot.column(column), value)
+        return mask
+
+    weights = [getattr(body.weights, name) for name in FACTORS]
+    try:
+        # Filters, factors and rows all come from the same snapshot
+        index = scoring_index.current()
+        positions, scores, matches = index.top(
+            weights, body.limit, where if filters else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Prepare features for all properties
-        feature_cols = ['latitude', 'longitude', 'annual_ghi', 'annual_dni',
-                        'annual_tilt_latitude', 'nearest_substation_km']
-
-        # Build feature matrix
-        X = []
-        valid_properties = []
-        for p in properties:
-            if p.id == property_id:
-                continue  # Skip the target property itself
-            if all([getattr(p, col) is not None for col in feature_cols]):
-                X.append([getattr(p, col) for col in feature_cols])
-                valid_properties.append(p)
-
-        if len(X) < k:
-            raise HTTPException(
-                status_code=400, detail="Not enough properties for comparison")
+    rows = index.snapshot.rows
+    total = sum(weights)
+    return {
+        "weights": {name: w / total for name, w in zip(FACTORS, weights)},
+        "total_matches": matches,
+        "results": [{"property": rows[pos], "score": float(score)}
+                    for pos, score in zip(positions, scores)],
+    }
 
-        X = np.array(X)
 
-        # Normalize features
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+CHART_CACHE_CONTROL = "public, max-age=3600"
 
-        # Prepare query features
-        query_features = np.array(
-            [[getattr(target_property, col) for col in feature_cols]])
-        query_scaled = scaler.transform(query_features)
 
-        # Find k nearest neighbors
-        knn = NearestNeighbors(n_neighbors=k, metric='euclidean')
-        knn.fit(X_scaled)
-        distances, indices = knn.kneighbors(query_scaled)
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match names ``etag`` (or is ``*``), i.e. a 304 will do."""
+    if_none_match = request.headers.get("if-none-match", "")
+    return etag in if_none_match or if_none_match.strip() == "*"
 
-        # Return similar properties
-        similar = []
-        for idx, dist in zip(indices[0], distances[0]):
-            prop = valid_properties[idx]
-            similar.append({
-                "property": prop,
-                "similarity_distance": float(dist)
-            })
 
-        return similar
+@app.get("/forecast_chart")
+async def forecast_chart(request: Request, state: str,
+                         years_ahead: int = Query(..., ge=1, le=MAX_FORECAST_YEARS)):
+    inputs = await run_in_threadpool(forecast_inputs)
+    # Before any conditional response, so unknown states never get a 304
+    if state not in inputs.energy_features.state_slices:
+        raise HTTPException(status_code=404, detail="State data not found")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    key = chart_key(state, years_ahead, inputs.model_fingerprint, inputs.data_fingerprint)
+    headers = {"ETag": f'"{key}"', "Cache-Control": CHART_CACHE_CONTROL}
+
+    # The ETag names the exact chart, so a match needs no lookup at all
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    png = await run_in_threadpool(chart_cache.get, key)
+    if png is None:
+        # May fall back to live inference, so keep it off the event loop too
+        forecast_df = await run_in_threadpool(forecast_trajectory, state, years_ahead, inputs)
+        try:
+            png = await chart_renderer.render(
+                key, state, years_ahead,
+                forecast_df['Year'].tolist(),
+                forecast_df['Pred_PercentRenewable'].tolist(),
+                forecast_df['Pred_PercentNonRenewable'].tolist())
+        except RendererBusy:
+            raise HTTPException(
+                status_code=503, detail="Chart renderer is busy, try again shortly",
+                headers={"Retry-After": "1"})
+        await run_in_threadpool(chart_cache.put, key, png)
+
+    return Response(png, media_type="image/png", headers=headers)
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def series_to_arrow(history: pd.DataFrame, forecast_df: pd.DataFrame) -> bytes:
+    import pyarrow as pa
+
+    n_hist, n_fc = len(history), len(forecast_df)
+    table = pa.table({
+        "year": pa.array(np.concatenate([history['Year'].to_numpy(), forecast_df['Year'].to_numpy()]),
+                         type=pa.int16()),
+        "percent_renewable": np.concatenate([history['PercentRenewable'].to_numpy(),
+                                             forecast_df['Pred_PercentRenewable'].to_numpy()]),
+        "percent_nonrenewable": np.concatenate([history['PercentNonRenewable'].to_numpy(),
+                                                forecast_df['Pred_PercentNonRenewable'].to_numpy()]),
+        # 0/1 class label, as in the JSON response; null for history years
+        "increase_renewable": pa.array(
+            [None] * n_hist + forecast_df['Pred_IncreaseRenewable'].astype(int).tolist(),
+            type=pa.int8()),
+        "is_forecast": np.concatenate([np.zeros(n_hist, bool), np.ones(n_fc, bool)]),
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+@app.get("/forecast_series")
+def get_forecast_series(
+    request: Request,
+    state: str = Query(..., min_length=2, max_length=2),
+    years_ahead: int = Query(..., ge=1, le=MAX_FORECAST_YEARS),
+    format: str = Query("json", pattern="^(json|arrow)$"),
+    precision: int = Query(3, ge=0, le=12)
+):
+    """
+    Data behind /forecast_chart as columns, for drawing the chart client-side.
+    ``format=arrow`` returns one Arrow IPC stream (needs pyarrow installed).
+    """
+    state = state.upper()
+    inputs = forecast_inputs()
+    # As for /forecast_chart: unknown states never get a 304
+    if state not in inputs.energy_features.state_slices:
+        raise HTTPException(status_code=404, detail="State data not found")
 
+    tag = chart_key(state, years_ahead, inputs.model_fingerprint, inputs.data_fingerprint)
+    etag = f'"{tag}-{format}-{precision}"'
+    headers = {"ETag": etag, "Cache-Control": CHART_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
 
-@app.get("/forecast_chart")
-async def forecast_chart(state: str, years_ahead: int):
-    fig = create_forecast_figure(state, years_ahead)
-
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+    forecast_df = forecast_trajectory(state, years_ahead, inputs)
+    history = inputs.energy_features.state_frame(state)
+
+    if format == "arrow":
+        try:
+            body = series_to_arrow(history, forecast_df)
+        except ImportError:
+            raise HTTPException(
+                status_code=406, detail="Arrow output requires pyarrow on the server")
+        return Response(body, media_type=ARROW_STREAM, headers=headers)
+
+    def col(values):
+        return np.round(np.asarray(values, dtype=float), precision).tolist()
+
+    return JSONResponse({
+        "state": state,
+        "years_ahead": years_ahead,
+        "history": {
+            "year": history['Year'].tolist(),
+            "percent_renewable": col(history['PercentRenewable']),
+            "percent_nonrenewable": col(history['PercentNonRenewable']),
+        },
+        "forecast": {
+            "year": forecast_df['Year'].tolist(),
+            "percent_renewable": col(forecast_df['Pred_PercentRenewable']),
+            "percent_nonrenewable": col(forecast_df['Pred_PercentNonRenewable']),
+            "increase_renewable": forecast_df['Pred_IncreaseRenewable'].astype(int).tolist(),
+        },
+    }, headers=headers)
+
+
+@app.get("/forecast_chart/stats")
+def get_forecast_chart_stats():
+    return {"renderer": chart_renderer.stats(), "disk_cache": chart_cache.stats()}
@@ -0,0 +1,101 @@
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.neighbors import KDTree
+from sklearn.preprocessing import StandardScaler
+
+from property_store import PropertyStore, StoreSnapshot
+
+SIMILARITY_COLS = [
+    "Latitude", "Longitude", "Annual_GHI", "Annual_DNI",
+    "Annual_Tilt_Latitude", "nearest_substation_km",
+]
+
+
+class SimilaritySnapshot:
+    """
+    KD-tree built from one store snapshot. Never modified after it's
+    built, and query results are positions into ``snapshot``.
+    """
+
+    def __init__(self, snapshot: StoreSnapshot, feature_cols: Sequence[str]):
+        self.snapshot = snapshot
+        cols = [snapshot.col_index[c] for c in feature_cols]
+        X = snapshot.values[:, cols]
+        valid = ~np.isnan(X).any(axis=1)
+
+        # Row position (in the snapshot) of every indexed point, and the reverse
+        self.positions = np.flatnonzero(valid)
+        self.scaler = StandardScaler().fit(X[valid]) if valid.any() else None
+        self.scaled = self.scaler.transform(X[valid]) if valid.any() else np.empty((0, len(cols)))
+        self.tree = KDTree(self.scaled) if valid.any() else None
+        self.index_of = np.full(len(X), -1, dtype=np.int64)
+        self.index_of[self.positions] = np.arange(len(self.positions))
+
+    def query(self, property_ids: Sequence[int], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k neighbours (excluding the property itself) for every id in one
+        vectorized tree query. Returns (snapshot positions, distances) per id.
+
+        Raises KeyError for an unknown id and ValueError if a property has
+        no complete feature vector or there are fewer than k candidates.
+        """
+        rows = []
+        for pid in property_ids:
+            pos = self.snapshot.positions.get(pid)
+            if pos is None:
+                raise KeyError(pid)
+            row = self.index_of[pos]
+            if row < 0:
+                raise ValueError(f"Property {pid} is missing similarity features")
+            rows.append(row)
+
+        if len(self.positions) - 1 < k:
+            raise ValueError("Not enough properties for comparison")
+
+        distances, indices = self.tree.query(self.scaled[rows], k=k + 1)
+
+        results = []
+        for row, dist, idx in zip(rows, distances, indices):
+            # Drop the query point; if ties pushed it out, drop the farthest
+            keep = idx != row
+            if keep.all():
+                keep[-1] = False
+            results.append((self.positions[idx[keep]], dist[keep]))
+        return results
+
+
+class SimilarityIndex:
+    """
+    Standardized KD-tree over the property store's similarity features.
+
+    Built once and rebuilt only when the store's version changes, so a
+    lookup is a single tree query instead of a scaler + kNN refit.
+    Properties with a missing feature are left out of the index.
+    Each build is a new SimilaritySnapshot swapped in whole, so readers
+    never see a half-updated index.
+    """
+
+    def __init__(self, store: PropertyStore, feature_cols: Sequence[str] = SIMILARITY_COLS):
+        self.store = store
+        self.feature_cols = list(feature_cols)
+        self._current: Optional[SimilaritySnapshot] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> SimilaritySnapshot:
+        snapshot = self.store.snapshot()
+        built = self._current
+        if built is not None and built.snapshot is snapshot:
+            return built
+        with self._lock:
+            if self._current is None or self._current.snapshot.version < snapshot.version:
+                self._current = SimilaritySnapshot(snapshot, self.feature_cols)
+            return self._current
+
+    def ensure_current(self):
+        self.current()
+
+    def query(self, property_ids: Sequence[int], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """See SimilaritySnapshot.query; positions index ``current().snapshot``."""
+        return self.current().query(property_ids, k)
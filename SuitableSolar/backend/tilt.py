@@ -1,109 +1,199 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 import numpy as np
-import requests
 import math
 
+from elevation import DEMElevation, OpenMeteoElevation
+
+# Sampling grid: GRID_STEPS points per radius in each direction, kept
+# inside the parcel's circle
+GRID_STEPS = 5
+CHUNKSIZE = 500
+
+M_PER_DEG_LAT = 111320
+M_PER_DEG_LON_EQUATOR = 40008000 / 360
+
 # ------------------------------
 # Helper Functions
 # ------------------------------
 
 
-def generate_coordinates(lat, lon, radius_m, step_m=50):
+def _unit_disk(steps=GRID_STEPS):
+    """Offsets (in radii) of the sample points inside the unit circle."""
+    u = np.linspace(-1, 1, 2 * steps + 1)
+    east, north = np.meshgrid(u, u)
+    inside = east ** 2 + north ** 2 <= 1 + 1e-9
+    return east[inside], north[inside]
+
+
+def generate_coordinates(lat, lon, radius_m, steps=GRID_STEPS):
     """
-    Generate a grid of latitude and longitude points within a circular radius.
+    Latitudes and longitudes of a grid of points inside a circular radius,
+    for arrays of parcels at once: returns two (parcels x points) arrays.
     """
-    lat_step = step_m / 111320
-    lon_step = step_m / (40008000 * np.cos(np.radians(lat)) / 360)
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))[:, None]
+    lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))[:, None]
+    radius_m = np.atleast_1d(np.asarray(radius_m, dtype=np.float64))[:, None]
+    east, north = _unit_disk(steps)
 
-    latitudes = np.arange(lat - radius_m/111320, lat +
-                          radius_m/111320, lat_step)
-    longitudes = np.arange(lon - radius_m/(40008000*np.cos(np.radians(lat))/360),
-                           lon + radius_m /
-                           (40008000*np.cos(np.radians(lat))/360),
-                           lon_step)
-    return [(lat, lon) for lat in latitudes for lon in longitudes]
+    lats = lat + north * radius_m / M_PER_DEG_LAT
+    lons = lon + east * radius_m / (M_PER_DEG_LON_EQUATOR * np.cos(np.radians(lat)))
+    return lats, lons
 
 
-def fetch_elevation(lat, lon):
+def fetch_elevation(lat, lon, sampler=None):
     """
-    Fetch elevation from Open-Meteo API.
-    Returns a float (meters) or None.
+    Fetch elevation for a single point (meters) or None.
+    Prefer passing whole batches to the sampler; this is one lookup.
     """
-    url = f"https://api.open-meteo.com/v1/elevation?latitude={lat}&longitude={lon}"
-    try:
-        resp = requests.get(url, timeout=10)
-        data = resp.json()
-        elev = data.get('elevation', None)
-        # If API returns a list, take first element
-        if isinstance(elev, list):
-            elev = elev[0]
-        return elev
-    except:
-        return None
-
-
-def compute_tilt(elevations, distances):
-    """
-    Compute approximate average tilt (degrees) from elevations and distances.
-    Skips None values.
-    """
-    flat_elev = [e for e in elevations if isinstance(e, (int, float))]
-    flat_dist = [d for d in distances if isinstance(d, (int, float))]
+    sampler = sampler or OpenMeteoElevation()
+    elev = sampler.elevations([lat], [lon])[0]
+    return None if np.isnan(elev) else float(elev)
 
-    if len(flat_elev) < 2 or len(flat_dist) == 0:
-        return 0
 
-    dz = max(flat_elev) - min(flat_elev)
-    dx = max(flat_dist)
-
-    return math.degrees(math.atan(dz/dx)) if dx != 0 else 0
+def fit_slope_aspect(elevations, radius_m, steps=GRID_STEPS):
+    """
+    Least-squares plane z = a*east + b*north + c through each parcel's
+    samples (rows of ``elevations``, NaN = missing), solved for all parcels
+    at once. Returns slope (degrees from horizontal) and aspect (compass
+    bearing the slope faces, 0 = N, 180 = S; NaN when flat).
+    Parcels with fewer than 3 usable samples, or without a positive
+    finite radius, get slope 0, aspect NaN.
+    """
+    east, north = _unit_disk(steps)
+    X = np.stack([east, north, np.ones_like(east)], axis=1)           # (k, 3)
+    z = np.asarray(elevations, dtype=np.float64)
+    w = (~np.isnan(z)).astype(np.float64)                             # (p, k)
+    z = np.where(w > 0, z, 0.0)
+
+    # Weighted normal equations for every parcel
+    A = np.einsum('pk,ki,kj->pij', w, X, X)
+    rhs = np.einsum('pk,ki->pi', w * z, X)
+
+    # A zero radius (acres = 0) puts every sample on one point; the unit
+    # disk offsets would still look solvable
+    radius_m = np.broadcast_to(np.asarray(radius_m, dtype=np.float64), (len(z),))
+    sized = np.isfinite(radius_m) & (radius_m > 0)
+    solvable = sized & (w.sum(axis=1) >= 3) & (np.abs(np.linalg.det(A)) > 1e-9)
+    coef = np.zeros((len(z), 3))
+    if solvable.any():
+        coef[solvable] = np.linalg.solve(A[solvable], rhs[solvable][:, :, None])[:, :, 0]
+
+    # Offsets were in radii; convert the gradient to metres per metre
+    dz_east = np.zeros(len(z))
+    dz_north = np.zeros(len(z))
+    dz_east[solvable] = coef[solvable, 0] / radius_m[solvable]
+    dz_north[solvable] = coef[solvable, 1] / radius_m[solvable]
+
+    slope = np.degrees(np.arctan(np.hypot(dz_east, dz_north)))
+    # The slope faces downhill, i.e. along minus the gradient
+    aspect = np.degrees(np.arctan2(-dz_east, -dz_north)) % 360
+    aspect[slope == 0] = np.nan
+    return slope, aspect
+
+
+def parcel_terrain(df, sampler, steps=GRID_STEPS) -> pd.DataFrame:
+    """tilt_deg and aspect_deg for every row (latitude, longitude, acres) of df."""
+    # Convert acres to radius in meters
+    radius_m = np.sqrt(df['acres'].to_numpy(dtype=np.float64) * 4046.86 / math.pi)
+    lats, lons = generate_coordinates(df['latitude'], df['longitude'], radius_m, steps)
+
+    # Parcels without coordinates or area can't be measured; keep their
+    # points out of the sampler's batches (they'd fail a whole request)
+    measurable = (np.isfinite(radius_m) & (radius_m > 0)
+                  & np.isfinite(lats).all(axis=1) & np.isfinite(lons).all(axis=1))
+    elevations = np.full(lats.shape, np.nan)
+    if measurable.any():
+        elevations[measurable] = sampler.elevations(
+            lats[measurable].ravel(), lons[measurable].ravel()).reshape(-1, lats.shape[1])
+    slope, aspect = fit_slope_aspect(elevations, radius_m, steps)
+    return pd.DataFrame({'tilt_deg': slope, 'aspect_deg': aspect}, index=df.index)
 
 # ------------------------------
 # Main Function
 # ------------------------------
 
 
-def add_tilt_to_csv(input_csv, output_csv):
-    """
-    Reads properties CSV, computes tilt for each property, and saves to new CSV.
-    """
-    df = pd.read_csv(input_csv)
-    tilts = []
+_worker_sampler = None
+
+
+def _init_worker(dem_dir):
+    global _worker_sampler
+    _worker_sampler = DEMElevation(dem_dir)
+
 
-    for idx, row in df.iterrows():
-        lat = row['latitude']
-        lon = row['longitude']
-        acres = row['acres']
+def _terrain_chunk(chunk):
+    return parcel_terrain(chunk, _worker_sampler)
 
-        # Convert acres to radius in meters
-        radius_m = math.sqrt(acres * 4046.86 / math.pi)
 
-        # Generate grid points
-        coords = generate_coordinates(lat, lon, radius_m, step_m=radius_m/5)
+def _chunk_results(df, sampler, dem_dir, workers, chunksize):
+    """Yield (chunk index, terrain frame) as chunks finish."""
+    chunks = [df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize)]
 
-        elevations = []
-        distances = []
+    if dem_dir is None:
+        # Network-bound: the sampler batches and caches requests itself
+        for i, chunk in enumerate(chunks):
+            yield i, parcel_terrain(chunk, sampler)
+        return
 
-        for clat, clon in coords:
-            elev = fetch_elevation(clat, clon)
-            if elev is not None:
-                elevations.append(elev)
+    # Local DEM: CPU-bound, so fan chunks out over processes
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(str(dem_dir),)) as pool:
+        futures = {pool.submit(_terrain_chunk, chunk): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
-                # Distance from center in meters
-                d_lat = (clat - lat) * 111320
-                d_lon = (clon - lon) * (40008000 *
-                                        np.cos(np.radians(lat)) / 360)
-                distances.append(math.hypot(d_lat, d_lon))
 
-        tilt_deg = compute_tilt(elevations, distances)
-        tilts.append(tilt_deg)
-        print(f"Processed property {idx+1}/{len(df)}: Tilt ≈ {tilt_deg:.2f}°")
+def add_tilt_to_csv(input_csv, output_csv, sampler=None, dem_dir=None,
+                    workers=None, chunksize=CHUNKSIZE):
+    """
+    Reads properties CSV, computes tilt (slope) and aspect for each
+    property, and saves to new CSV. With ``dem_dir`` the work is spread
+    over a process pool reading local DEM tiles; otherwise ``sampler``
+    (Open-Meteo by default) is used. Chunks are written as soon as every
+    chunk before them is done, so the output keeps the input order.
+    """
+    df = pd.read_csv(input_csv)
+    if dem_dir is None:
+        sampler = sampler or OpenMeteoElevation()
 
-    df['tilt_deg'] = tilts
-    df.to_csv(output_csv, index=False)
+    tmp = f"{output_csv}.tmp{os.getpid()}"
+    done = {}
+    next_chunk = 0
+    n_chunks = math.ceil(len(df) / chunksize)
+    try:
+        for i, terrain in _chunk_results(df, sampler, dem_dir, workers, chunksize):
+            done[i] = terrain
+            while next_chunk in done:
+                terrain = done.pop(next_chunk)
+                out = df.loc[terrain.index].copy()
+                out['tilt_deg'] = terrain['tilt_deg']
+                out['aspect_deg'] = terrain['aspect_deg']
+                out.to_csv(tmp, mode='w' if next_chunk == 0 else 'a',
+                           header=next_chunk == 0, index=False)
+                next_chunk += 1
+                print(f"Processed chunk {next_chunk}/{n_chunks} "
+                      f"({min(next_chunk * chunksize, len(df))}/{len(df)} properties)")
+        if n_chunks == 0:
+            df.assign(tilt_deg=[], aspect_deg=[]).to_csv(tmp, index=False)
+        os.replace(tmp, output_csv)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
     print(f"\nSaved results to {output_csv}")
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Add terrain tilt and aspect to a properties CSV")
+    parser.add_argument("--dem", help="directory of DEM tiles (.hgt / GeoTIFF) to use instead of Open-Meteo")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+
     add_tilt_to_csv('backend/data/newdata.csv',
-                    'backend/data/properties_with_tilt.csv')
+                    'backend/data/properties_with_tilt.csv',
+                    dem_dir=args.dem, workers=args.workers, chunksize=args.chunksize)
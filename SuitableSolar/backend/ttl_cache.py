@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries also expire after ``ttl``
+    seconds. Keeps hit/miss/eviction counters for monitoring.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def file_sha(path) -> str:
+    """
+    Short SHA-256 of a file's contents. Remembered per (size, mtime), so
+    calling it again for an unchanged file costs one stat.
+    """
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        hit = _digests.get(path)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    digest = h.hexdigest()[:16]
+    with _digests_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+
+def file_fingerprint(*paths) -> str:
+    """
+    Short hash of the contents of each file, in order. Unaffected by
+    checkouts, copies or deploys that only change mtimes.
+    """
+    h = hashlib.sha1()
+    for path in paths:
+        h.update(f"{file_sha(path)};".encode())
+    return h.hexdigest()[:16]